@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""run_bench.py
+Benchmark brew_index.py and brew_first_installs.py against a synthetic environment.
+
+Usage:
+    python3 bench/run_bench.py [--kegs N] [--repeat N] [--output results.json]
+    python3 bench/run_bench.py --compare old.json new.json
+
+Each scenario runs the tools as fresh processes with fake brew/gh/git on PATH
+(see synth_env.py) and a local stub GitHub API (see stub_github.py), and records
+wall time, CPU time, peak RSS, subprocess spawns by tool and GitHub requests.
+Use --tools-dir to benchmark another checkout (e.g. a git worktree of an older
+version) with the same harness, then --compare the two result files.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from stub_github import StubGitHub
+from synth_env import create_env
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# name -> cmd, commands to run (unmeasured) before each repeat, whether to hide local tap clones.
+# {index} and {query} expand to the tool scripts under --tools-dir.
+SCENARIOS = {
+    "index-full": {"cmd": ["{index}"]},
+    "index-incremental-warm": {"cmd": ["{index}", "--incremental"], "prepare": [["{index}", "--incremental"]]},
+    "index-enrich-http": {"cmd": ["{index}", "--enrich", "--no-cache", "--transport", "http"], "hide_taps": True},
+    "index-enrich-graphql": {"cmd": ["{index}", "--enrich", "--no-cache", "--transport", "graphql"], "hide_taps": True},
+    "index-enrich-gh": {"cmd": ["{index}", "--enrich", "--no-cache", "--transport", "gh"], "hide_taps": True},
+    "index-enrich-local": {"cmd": ["{index}", "--enrich", "--no-cache", "--offline"]},
+    "index-enrich-cached": {"cmd": ["{index}", "--enrich", "--transport", "http"], "hide_taps": True,
+                            "prepare": [["{index}", "--enrich", "--transport", "http"]]},
+    "index-available": {"cmd": ["{index}", "--available"]},
+    "index-available-warm": {"cmd": ["{index}", "--available"], "prepare": [["{index}", "--available"]]},
+    "query-30d": {"cmd": ["{query}", "30", "0", "--json"], "prepare": [["{index}"]]},
+    "query-all": {"cmd": ["{query}", "36500", "0", "--json"], "prepare": [["{index}"]]},
+    "query-sqlite-30d": {"cmd": ["{query}", "30", "0", "--json"], "prepare": [["{index}", "--sqlite"]]},
+    "query-info-30d": {"cmd": ["{query}", "30", "0", "--info"], "prepare": [["{index}"]]},
+}
+
+def expand(cmd, tools_dir):
+    scripts = {
+        "{index}": str(tools_dir / "brew_conversion" / "brew_index.py"),
+        "{query}": str(tools_dir / "brew_first_installs.py"),
+    }
+    return [sys.executable, scripts[cmd[0]]] + cmd[1:]
+
+def clean_index(env_root):
+    # Every scenario starts from no index, state or caches
+    repo = env_root / "repo"
+    for p in repo.iterdir():
+        if p.name.startswith("installs_index"):
+            p.unlink()
+
+def run_measured(cmd, env, log_path, err_path):
+    open(log_path, "w").close()
+    with open(err_path, "ab") as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=err)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    rss_kib = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    with open(log_path) as f:
+        spawns = Counter(line.split(" ", 1)[0] for line in f if line.strip())
+    return {
+        "wall_s": wall,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_kib": rss_kib,
+        "subprocesses": dict(spawns),
+        "exit_code": proc.returncode,
+    }
+
+def run_scenario(name, spec, tools_dir, env_root, env, stub, repeat):
+    taps = env_root / "repo" / "Library" / "Taps"
+    hidden = taps.with_name("Taps.hidden")
+    log_path = env_root / "bench_calls.log"
+    err_path = env_root / "logs" / f"{name}.log"
+    err_path.parent.mkdir(exist_ok=True)
+    err_path.write_text("")
+
+    runs = []
+    for _ in range(repeat):
+        clean_index(env_root)
+        if spec.get("hide_taps"):
+            taps.rename(hidden)
+        try:
+            for prep in spec.get("prepare", []):
+                subprocess.run(expand(prep, tools_dir), env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+            stub.reset_counters()
+            run = run_measured(expand(spec["cmd"], tools_dir), env, log_path, err_path)
+            run["github_requests"] = stub.requests
+            run["github_connections"] = stub.connections
+            runs.append(run)
+        finally:
+            if spec.get("hide_taps"):
+                hidden.rename(taps)
+        if run["exit_code"] != 0:
+            break
+
+    walls = [r["wall_s"] for r in runs]
+    last = runs[-1]
+    return {
+        "wall_s": walls,
+        "wall_median_s": statistics.median(walls),
+        "wall_min_s": min(walls),
+        "cpu_median_s": statistics.median(r["cpu_s"] for r in runs),
+        "peak_rss_kib": max(r["peak_rss_kib"] for r in runs),
+        "subprocesses": last["subprocesses"],
+        "github_requests": last["github_requests"],
+        "github_connections": last["github_connections"],
+        "exit_code": last["exit_code"],
+    }
+
+def git_rev(path):
+    try:
+        return subprocess.check_output(["git", "-C", str(path), "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+def print_results(results):
+    print(f"{'scenario':<26} {'wall(s)':>9} {'cpu(s)':>8} {'rss(MiB)':>9} {'gh reqs':>8}  spawns")
+    for name, r in results["results"].items():
+        spawns = " ".join(f"{k}={v}" for k, v in sorted(r["subprocesses"].items()))
+        status = "" if r["exit_code"] == 0 else f"  (exit {r['exit_code']})"
+        print(f"{name:<26} {r['wall_median_s']:>9.3f} {r['cpu_median_s']:>8.3f} "
+              f"{r['peak_rss_kib'] / 1024:>9.1f} {r['github_requests']:>8}  {spawns}{status}")
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old['meta'].get('tools_rev')}  new: {new['meta'].get('tools_rev')}")
+    print(f"{'scenario':<26} {'old(s)':>9} {'new(s)':>9} {'speedup':>8} {'old MiB':>8} {'new MiB':>8} {'old spawns':>11} {'new spawns':>11}")
+    for name, n in new["results"].items():
+        o = old["results"].get(name)
+        if not o:
+            continue
+        if o["exit_code"] != 0 or n["exit_code"] != 0:
+            print(f"{name:<26} (failed: old exit {o['exit_code']}, new exit {n['exit_code']})")
+            continue
+        speedup = o["wall_median_s"] / n["wall_median_s"] if n["wall_median_s"] else float("inf")
+        print(f"{name:<26} {o['wall_median_s']:>9.3f} {n['wall_median_s']:>9.3f} {speedup:>7.2f}x "
+              f"{o['peak_rss_kib'] / 1024:>8.1f} {n['peak_rss_kib'] / 1024:>8.1f} "
+              f"{sum(o['subprocesses'].values()):>11} {sum(n['subprocesses'].values()):>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark brew-index and brew-first-installs on a synthetic environment.")
+    parser.add_argument("--kegs", type=int, default=1000, help="Installed formula kegs to generate")
+    parser.add_argument("--casks", type=int, default=100, help="Installed casks to generate")
+    parser.add_argument("--env", help="Environment directory (default: a temporary directory)")
+    parser.add_argument("--reuse", action="store_true", help="Reuse an existing environment in --env")
+    parser.add_argument("--tools-dir", default=str(REPO_ROOT), help="Checkout whose tools are benchmarked")
+    parser.add_argument("--scenarios", default="*", help="Comma-separated scenario names or globs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-ms", type=int, default=20, help="Stub GitHub API latency per request")
+    parser.add_argument("--brew-delay", type=float, default=0.0, help="Seconds each fake brew call sleeps (Ruby startup)")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.list:
+        for name, spec in SCENARIOS.items():
+            print(f"{name:<26} {' '.join(spec['cmd'])}")
+        return
+
+    patterns = args.scenarios.split(",")
+    selected = {n: s for n, s in SCENARIOS.items() if any(fnmatch.fnmatch(n, p) for p in patterns)}
+    if not selected:
+        parser.error(f"no scenarios match {args.scenarios}")
+
+    tmp = None
+    if args.env:
+        env_root = Path(args.env).resolve()
+    else:
+        tmp = tempfile.mkdtemp(prefix="brew-bench-")
+        env_root = Path(tmp) / "env"
+
+    if args.reuse and (env_root / "env.json").is_file():
+        meta = json.loads((env_root / "env.json").read_text())
+    else:
+        print(f"Generating {args.kegs} kegs and {args.casks} casks in {env_root}...", file=sys.stderr)
+        meta = create_env(env_root, args.kegs, args.casks)
+
+    stub = StubGitHub(latency_ms=args.latency_ms).start()
+    env = dict(os.environ)
+    env["PATH"] = f"{env_root / 'bin'}{os.pathsep}{env.get('PATH', '')}"
+    env["BENCH_LOG"] = str(env_root / "bench_calls.log")
+    env["BENCH_BREW_DELAY"] = str(args.brew_delay)
+    env["GITHUB_API_URL"] = stub.url
+    env["GH_TOKEN"] = "bench-token"
+    env["XDG_CACHE_HOME"] = str(env_root / "cache")
+    for var in ("HOMEBREW_REPOSITORY", "HOMEBREW_CELLAR", "HOMEBREW_PREFIX"):
+        env.pop(var, None)
+
+    tools_dir = Path(args.tools_dir).resolve()
+    results = {
+        "meta": {
+            "tools_dir": str(tools_dir),
+            "tools_rev": git_rev(tools_dir),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeat": args.repeat,
+            "latency_ms": args.latency_ms,
+            "brew_delay_s": args.brew_delay,
+            "env": meta,
+        },
+        "results": {},
+    }
+    try:
+        for name, spec in selected.items():
+            print(f"Running {name}...", file=sys.stderr)
+            results["results"][name] = run_scenario(name, spec, tools_dir, env_root, env, stub, args.repeat)
+    finally:
+        stub.stop()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
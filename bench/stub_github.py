@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""stub_github.py
+Local stand-in for the parts of the GitHub API that brew-index --enrich uses.
+
+    GET  /repos/<owner>/<repo>/commits?path=<path>&per_page=1[&page=N]
+    POST /graphql   repository { defaultBranchRef { target { ... on Commit {
+                        hN: history(path: $pN, first: 1[, after: $cN]) { ... } } } } }
+
+Every path gets a deterministic number of commits and oldest-commit date, with
+Link and X-RateLimit-* headers like the real API. GraphQL only understands the
+aliased history() queries brew-index sends, and answers queries with more than
+--graphql-max-aliases fields with a 502, as GitHub does for oversized queries.
+Keep-alive (HTTP/1.1) is supported so pooled clients can be measured. Point
+GITHUB_API_URL at it.
+
+Usage:
+    python3 bench/stub_github.py [--port N] [--latency-ms N] [--graphql-max-aliases N]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+def history_for(path):
+    # (last_page, oldest commit date) derived from the path alone
+    h = zlib.crc32(path.encode())
+    last_page = 1 + h % 40
+    epoch = 1262304000 + h % (14 * 365 * 86400)  # 2010 .. 2024
+    date = datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return last_page, date
+
+def history_connection(path, fields, after=None):
+    # The history(path:, first: 1[, after:]) connection; commits are newest first
+    total, date = history_for(path)
+    oid = f"{zlib.crc32(path.encode()):08x}" * 5
+    index = 0
+    if after is not None:
+        index = int(after.rpartition(" ")[2]) + 1
+    nodes = []
+    if index < total:
+        nodes.append({"committedDate": date if index == total - 1 else "2024-06-01T00:00:00Z"})
+    result = {"nodes": nodes}
+    if "totalCount" in fields:
+        result["totalCount"] = total
+    if "pageInfo" in fields:
+        result["pageInfo"] = {"endCursor": f"{oid} {index}" if nodes else None, "hasNextPage": index < total - 1}
+    return result
+
+HISTORY_FIELD = re.compile(r"(\w+): history\(path: \$(\w+), first: 1(?:, after: \$(\w+))?\) \{([^{}]*(?:\{[^{}]*\}[^{}]*)*)\}")
+
+class StubGitHub:
+    def __init__(self, port=0, latency_ms=0, rate_limit=5000, graphql_max_aliases=50):
+        self.latency = latency_ms / 1000.0
+        self.rate_limit = rate_limit
+        self.graphql_max_aliases = graphql_max_aliases
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def send_json(self, status, payload, headers=()):
+                body = json.dumps(payload).encode()
+                with stub._lock:
+                    stub.requests += 1
+                    remaining = max(0, stub.rate_limit - stub.requests)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-RateLimit-Limit", str(stub.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(remaining))
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlsplit(self.path)
+                parts = url.path.strip("/").split("/")
+                if len(parts) != 4 or parts[0] != "repos" or parts[3] != "commits":
+                    self.send_json(404, {"message": "Not Found"})
+                    return
+                query = parse_qs(url.query)
+                path = query.get("path", [""])[0]
+                page = int(query.get("page", ["1"])[0])
+                last_page, date = history_for(path)
+
+                headers = []
+                if last_page > 1:
+                    base = f"https://api.github.com{url.path}?path={path}&per_page=1"
+                    headers.append(("Link", f'<{base}&page={min(page + 1, last_page)}>; rel="next", '
+                                            f'<{base}&page={last_page}>; rel="last"'))
+                commit_date = date if page >= last_page else "2024-06-01T00:00:00Z"
+                self.send_json(200, [{"sha": f"{zlib.crc32(path.encode()):08x}{page:032x}",
+                                      "commit": {"committer": {"date": commit_date}}}], headers)
+
+            def do_POST(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if urlsplit(self.path).path.rstrip("/") != "/graphql":
+                    self.send_json(404, {"message": "Not Found"})
+                    return
+                query = request.get("query", "")
+                variables = request.get("variables") or {}
+                fields = HISTORY_FIELD.findall(query)
+                if len(fields) > stub.graphql_max_aliases:
+                    self.send_json(502, {"message": "Server Error"})
+                    return
+                if variables.get("owner") is None or variables.get("name") is None:
+                    self.send_json(200, {"errors": [{"message": "owner and name are required"}]})
+                    return
+                target = {}
+                for alias, path_var, cursor_var, selection in fields:
+                    after = variables.get(cursor_var) if cursor_var else None
+                    target[alias] = history_connection(variables[path_var], selection, after)
+                self.send_json(200, {"data": {"repository": {"defaultBranchRef": {"target": target}}}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the GitHub commits API.")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every response")
+    parser.add_argument("--graphql-max-aliases", type=int, default=50,
+                        help="History fields per GraphQL query above which the stub answers 502")
+    args = parser.parse_args()
+
+    stub = StubGitHub(args.port, args.latency_ms, graphql_max_aliases=args.graphql_max_aliases)
+    print(f"export GITHUB_API_URL={stub.url}", flush=True)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{stub.requests} requests over {stub.connections} connections")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""synth_env.py
+Generate a synthetic Homebrew environment for benchmarking brew-index and brew-first-installs.
+
+Usage:
+    python3 bench/synth_env.py <root> [--kegs N] [--casks N] [--tap-formulae N] [--tap-casks N]
+
+Creates under <root>:
+    Cellar/<formula>/<version>/INSTALL_RECEIPT.json
+    Caskroom/<cask>/<version>/
+    repo/                              brew --repository (the index is written here)
+    repo/Library/Taps/homebrew/homebrew-{core,cask}   git taps with dated "add" commits
+    installed.json                     what `brew info --json=v2 --installed` returns
+    bin/{brew,gh,git}                  fake executables; put bin/ first on PATH
+
+The fake executables log one line per invocation to $BENCH_LOG (if set) so the
+harness can count subprocess spawns. The fake gh forwards `gh api` calls to
+$GITHUB_API_URL (see stub_github.py); BENCH_BREW_DELAY adds a per-call sleep to
+simulate Homebrew's Ruby startup.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import stat
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DAY = 86400
+
+FAKE_BREW = r'''#!/usr/bin/env python3
+import json, os, sys, time
+ROOT = {root!r}
+if os.environ.get("BENCH_LOG"):
+    with open(os.environ["BENCH_LOG"], "a") as f:
+        f.write("brew " + " ".join(sys.argv[1:]) + "\n")
+time.sleep(float(os.environ.get("BENCH_BREW_DELAY", "0")))
+args = sys.argv[1:]
+paths = {{"--repository": "repo", "--cellar": "Cellar", "--caskroom": "Caskroom", "--prefix": ""}}
+if args and args[0] in paths:
+    print(os.path.join(ROOT, paths[args[0]]).rstrip("/"))
+elif args[:1] == ["shellenv"]:
+    print(f'export HOMEBREW_PREFIX="{{ROOT}}";')
+    print(f'export HOMEBREW_CELLAR="{{ROOT}}/Cellar";')
+    print(f'export HOMEBREW_REPOSITORY="{{ROOT}}/repo";')
+elif args[:1] == ["tap-info"]:
+    taps = []
+    for name in ("homebrew/core", "homebrew/cask"):
+        user, repo = name.split("/")
+        taps.append({{"name": name, "remote": f"https://github.com/Homebrew/homebrew-{{repo}}",
+                      "path": os.path.join(ROOT, "repo/Library/Taps", user, f"homebrew-{{repo}}")}})
+    print(json.dumps(taps))
+elif args[:1] == ["info"] and "--json=v2" in args:
+    with open(os.path.join(ROOT, "installed.json")) as f:
+        data = json.load(f)
+    names = [a for a in args[1:] if not a.startswith("-")]
+    if "--installed" not in args:
+        wanted = set(names)
+        data = {{"formulae": [i for i in data["formulae"] if i["name"] in wanted],
+                 "casks": [i for i in data["casks"] if i["token"] in wanted]}}
+        known = {{i["name"] for i in data["formulae"]}} | {{i["token"] for i in data["casks"]}}
+        missing = wanted - known
+        if missing:
+            print(f"Error: No available formula with the name \"{{sorted(missing)[0]}}\".", file=sys.stderr)
+            sys.exit(1)
+    print(json.dumps(data))
+elif args[:1] == ["info"]:
+    print(f"==> {{args[-1]}}: stable 1.0")
+else:
+    print(f"fake brew: unsupported command {{args}}", file=sys.stderr)
+    sys.exit(1)
+'''
+
+FAKE_GH = r'''#!/usr/bin/env python3
+import http.client, os, sys
+from urllib.parse import urlsplit
+if os.environ.get("BENCH_LOG"):
+    with open(os.environ["BENCH_LOG"], "a") as f:
+        f.write("gh " + " ".join(sys.argv[1:]) + "\n")
+args = sys.argv[1:]
+if args[:2] == ["auth", "token"]:
+    print("bench-token")
+    sys.exit(0)
+if args[:1] != ["api"]:
+    sys.exit(1)
+include = "-i" in args
+endpoint = [a for a in args[1:] if a != "-i"][0]
+base = urlsplit(os.environ.get("GITHUB_API_URL", "http://127.0.0.1:1"))
+conn = http.client.HTTPConnection(base.hostname, base.port)
+conn.request("GET", base.path.rstrip("/") + endpoint, headers={{"Authorization": "Bearer bench-token"}})
+resp = conn.getresponse()
+body = resp.read().decode()
+if include:
+    print(f"HTTP/1.1 {{resp.status}} {{resp.reason}}")
+    for k, v in resp.getheaders():
+        print(f"{{k}}: {{v}}")
+    print()
+sys.stdout.write(body)
+sys.exit(0 if resp.status < 400 else 1)
+'''
+
+FAKE_GIT = '''#!/bin/sh
+[ -n "$BENCH_LOG" ] && echo "git $1 $2 $3" >> "$BENCH_LOG"
+exec {real_git} "$@"
+'''
+
+def write_executable(path, content):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def make_tap(tap_dir, files, now):
+    """Create a git repo whose history adds each (path, epoch) file in time order, via fast-import."""
+    tap_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["git", "init", "-q", str(tap_dir)], check=True)
+    subprocess.run(["git", "-C", str(tap_dir), "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+
+    chunks = []
+    for n, (path, epoch) in enumerate(sorted(files, key=lambda f: f[1])):
+        msg = f"{Path(path).stem} (new)\n".encode()
+        content = f"# {path}\n".encode()
+        chunks.append(b"commit refs/heads/main\n")
+        chunks.append(f"mark :{n + 1}\n".encode())
+        chunks.append(f"author Bench <bench@example.com> {epoch} +0000\n".encode())
+        chunks.append(f"committer Bench <bench@example.com> {epoch} +0000\n".encode())
+        chunks.append(f"data {len(msg)}\n".encode() + msg)
+        chunks.append(f"M 100644 inline {path}\n".encode())
+        chunks.append(f"data {len(content)}\n".encode() + content + b"\n")
+    subprocess.run(["git", "-C", str(tap_dir), "fast-import", "--quiet"],
+                   input=b"".join(chunks), check=True)
+    subprocess.run(["git", "-C", str(tap_dir), "checkout", "-q", "-f", "main"], check=True)
+
+def create_env(root, kegs=1000, casks=100, tap_formulae=None, tap_casks=None, seed=42):
+    root = Path(root).resolve()
+    if root.exists():
+        shutil.rmtree(root)
+    rng = random.Random(seed)
+    now = int(time.time())
+    tap_formulae = max(tap_formulae or kegs * 2, kegs)
+    tap_casks = max(tap_casks or casks * 2, casks)
+
+    # Formula names; roughly 1 in 5 installed formulae gets a second version
+    formulae = [f"synth-formula-{i:05d}" for i in range(tap_formulae)]
+    cask_names = [f"synth-cask-{i:05d}" for i in range(tap_casks)]
+    installed = {"formulae": [], "casks": []}
+
+    added = {}  # name -> epoch the file was added to its tap
+    for name in formulae + cask_names:
+        added[name] = now - rng.randrange(3 * 365 * DAY)
+
+    count = 0
+    for name in formulae:
+        if count >= kegs:
+            break
+        versions = ["1.0"] if rng.random() > 0.2 else ["1.0", "1.1"]
+        for version in versions[:kegs - count]:
+            d = root / "Cellar" / name / version
+            (d / "bin").mkdir(parents=True)
+            (d / "bin" / name).write_text("")
+            receipt = d / "INSTALL_RECEIPT.json"
+            receipt.write_text(json.dumps({"formula": {"name": name}, "installed_on_request": True}))
+            t = max(added[name], now - rng.randrange(2 * 365 * DAY))
+            os.utime(receipt, (t, t))
+            count += 1
+        installed["formulae"].append({
+            "name": name, "full_name": name, "aliases": [], "oldnames": [],
+            "tap": "homebrew/core", "ruby_source_path": f"Formula/{name[0]}/{name}.rb",
+            "desc": f"Synthetic formula {name}", "homepage": "https://example.com",
+            "license": "MIT", "versions": {"stable": versions[-1], "head": None, "bottle": True},
+            "installed": [{"version": v} for v in versions],
+            "dependencies": [], "build_dependencies": [],
+        })
+
+    for name in cask_names[:casks]:
+        d = root / "Caskroom" / name / "2.0"
+        d.mkdir(parents=True)
+        (root / "Caskroom" / name / ".metadata").mkdir()
+        t = max(added[name], now - rng.randrange(2 * 365 * DAY))
+        os.utime(d, (t, t))
+        installed["casks"].append({
+            "token": name, "full_token": name, "name": [name], "tap": "homebrew/cask",
+            "ruby_source_path": f"Casks/{name[0]}/{name}.rb", "desc": f"Synthetic cask {name}",
+            "homepage": "https://example.com", "version": "2.0", "installed": "2.0",
+        })
+
+    (root / "installed.json").write_text(json.dumps(installed))
+
+    taps = root / "repo" / "Library" / "Taps" / "homebrew"
+    make_tap(taps / "homebrew-core", [(f"Formula/{n[0]}/{n}.rb", added[n]) for n in formulae], now)
+    make_tap(taps / "homebrew-cask", [(f"Casks/{n[0]}/{n}.rb", added[n]) for n in cask_names], now)
+
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    real_git = shutil.which("git")
+    write_executable(bin_dir / "brew", FAKE_BREW.format(root=str(root)))
+    write_executable(bin_dir / "gh", FAKE_GH.format())
+    write_executable(bin_dir / "git", FAKE_GIT.format(real_git=real_git))
+
+    meta = {"kegs": count, "casks": casks, "tap_formulae": tap_formulae, "tap_casks": tap_casks,
+            "seed": seed, "created": now}
+    (root / "env.json").write_text(json.dumps(meta, indent=2))
+    return meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Homebrew environment for benchmarks.")
+    parser.add_argument("root", help="Directory to create (replaced if it exists)")
+    parser.add_argument("--kegs", type=int, default=1000, help="Installed formula kegs (Cellar version dirs)")
+    parser.add_argument("--casks", type=int, default=100, help="Installed casks")
+    parser.add_argument("--tap-formulae", type=int, help="Formula files in the synthetic homebrew-core tap (default: 2x kegs)")
+    parser.add_argument("--tap-casks", type=int, help="Cask files in the synthetic homebrew-cask tap (default: 2x casks)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    meta = create_env(args.root, args.kegs, args.casks, args.tap_formulae, args.tap_casks, args.seed)
+    print(json.dumps(meta, indent=2))
+    print(f"export PATH={Path(args.root).resolve() / 'bin'}:$PATH", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Resolve Homebrew's repository, prefix, Cellar and Caskroom paths cheaply.
+
+Shared by brew_index.py and brew_first_installs.py. In order:
+  1. HOMEBREW_REPOSITORY / HOMEBREW_CELLAR / HOMEBREW_PREFIX from the environment
+     (set by `brew shellenv`), with no subprocess at all;
+  2. a small cache file, valid while the `brew` executable it was resolved from
+     is unchanged and the paths still exist;
+  3. a single `brew shellenv` call (falling back to --repository/--cellar/
+     --caskroom if its output can't be parsed), whose result is cached.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+CACHE_VERSION = 1
+
+def cache_path():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "brew-tools", "brew_env.json")
+
+def _paths_from_prefix(prefix, repository=None, cellar=None):
+    if not repository:
+        # Intel installs keep the git checkout in <prefix>/Homebrew
+        nested = os.path.join(prefix, "Homebrew")
+        repository = nested if os.path.isdir(os.path.join(nested, "Library")) else prefix
+    if not cellar:
+        # Mirrors brew.sh: a Cellar inside the repository wins over <prefix>/Cellar
+        repo_cellar = os.path.join(repository, "Cellar")
+        cellar = repo_cellar if os.path.isdir(repo_cellar) else os.path.join(prefix, "Cellar")
+    return {
+        "repository": repository,
+        "prefix": prefix,
+        "cellar": cellar,
+        "caskroom": os.path.join(prefix, "Caskroom"),
+    }
+
+def _from_environment():
+    prefix = os.environ.get("HOMEBREW_PREFIX")
+    repository = os.environ.get("HOMEBREW_REPOSITORY")
+    cellar = os.environ.get("HOMEBREW_CELLAR")
+    if prefix:
+        return _paths_from_prefix(prefix, repository, cellar)
+    if repository and cellar:
+        # Cellar lives directly under the prefix
+        return _paths_from_prefix(os.path.dirname(cellar), repository, cellar)
+    return None
+
+def _brew_fingerprint(brew):
+    try:
+        st = os.stat(brew)
+    except OSError:
+        return None
+    return [os.path.realpath(brew), st.st_mtime_ns, st.st_size]
+
+def _load_cache(brew):
+    try:
+        with open(cache_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != CACHE_VERSION or data.get("brew") != brew:
+        return None
+    if data.get("fingerprint") != _brew_fingerprint(brew):
+        return None
+    paths = data.get("paths") or {}
+    if not paths.get("repository") or not os.path.isdir(paths["repository"]):
+        return None
+    return paths
+
+def _save_cache(brew, paths):
+    path = cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "brew": brew,
+                       "fingerprint": _brew_fingerprint(brew), "paths": paths}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: Failed to write brew path cache {path}: {e}", file=sys.stderr)
+
+def _run_brew(args, count_spawn):
+    if count_spawn:
+        count_spawn(args)
+    try:
+        return subprocess.check_output(args, text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+def _from_brew(brew, count_spawn):
+    # `brew shellenv` is handled in brew.sh without starting Ruby and reports all of it at once
+    out = _run_brew([brew, "shellenv", "bash"], count_spawn)
+    found = dict(re.findall(r'HOMEBREW_(PREFIX|CELLAR|REPOSITORY)[= ]"?([^";\n]+)"?', out or ""))
+    if "PREFIX" in found:
+        return _paths_from_prefix(found["PREFIX"], found.get("REPOSITORY"), found.get("CELLAR"))
+
+    repository = _run_brew([brew, "--repository"], count_spawn)
+    if not repository:
+        return None
+    return {
+        "repository": repository,
+        "prefix": _run_brew([brew, "--prefix"], count_spawn),
+        "cellar": _run_brew([brew, "--cellar"], count_spawn),
+        "caskroom": _run_brew([brew, "--caskroom"], count_spawn),
+    }
+
+def resolve_brew_paths(use_cache=True, count_spawn=None):
+    """Return {"repository", "prefix", "cellar", "caskroom"}; values are None if brew can't be found.
+
+    count_spawn, if given, is called with the argv of every brew process started.
+    """
+    paths = _from_environment()
+    if paths:
+        return paths
+
+    brew = shutil.which("brew")
+    if not brew:
+        return {"repository": None, "prefix": None, "cellar": None, "caskroom": None}
+
+    if use_cache:
+        paths = _load_cache(brew)
+        if paths:
+            return paths
+
+    paths = _from_brew(brew, count_spawn)
+    if not paths:
+        return {"repository": None, "prefix": None, "cellar": None, "caskroom": None}
+    if use_cache:
+        _save_cache(brew, paths)
+    return paths
@@ -8,33 +8,47 @@ Find packages whose first-installed date is between X and Y days ago.
 X = number of days ago (older). Y = number of days ago (newer).
 Example: $0 30 7      -> between 30 days ago and 7 days ago (inclusive)
 Add --json to output raw JSON objects (array).
+Reads installs_index in any --format/--compress (needs jq; gzip or zstd for compressed ones).
 USAGE
   exit 1
 fi
 
 X="$1"   # older bound (days ago)
 Y="$2"   # newer bound (days ago)
-OUT_JSON="$(brew --repository 2>/dev/null || echo "$HOME/.homebrew")/installs_index.json"
+REPO="$(brew --repository 2>/dev/null || echo "$HOME/.homebrew")"
 
-if [ ! -f "$OUT_JSON" ]; then
-  echo "Index file not found at $OUT_JSON"
+# Whichever installs_index variant brew_index.py wrote; the newest wins if several exist
+INDEX=""
+for f in "$REPO"/installs_index.{json,ndjson}{,.gz,.zst}; do
+  if [ -f "$f" ] && { [ -z "$INDEX" ] || [ "$f" -nt "$INDEX" ]; }; then
+    INDEX="$f"
+  fi
+done
+
+if [ -z "$INDEX" ]; then
+  echo "Index file not found at $REPO/installs_index.json"
   echo "Run the indexer script first."
   exit 2
 fi
 
-# compute epoch bounds (start = now - X*86400, end = now - Y*86400)
-start_epoch=$(python3 - <<PY
-import time,sys
-X=int(sys.argv[1])
-print(int(time.time()) - X*86400)
-PY
-"$X")
-end_epoch=$(python3 - <<PY
-import time,sys
-Y=int(sys.argv[1])
-print(int(time.time()) - Y*86400)
-PY
-"$Y")
+read_index() {
+  case "$INDEX" in
+    *.gz) gzip -dc "$INDEX" ;;
+    *.zst) zstd -dcq "$INDEX" ;;
+    *) cat "$INDEX" ;;
+  esac
+}
+
+# A JSON array of records, or one record per line (--format ndjson)
+case "$INDEX" in
+  *.ndjson*) ROWS='inputs' ;;
+  *) ROWS='inputs | .[]' ;;
+esac
+
+# compute epoch bounds (start = now - X*86400, end = now - Y*86400) without spawning python
+now=$(date +%s)
+start_epoch=$(( now - X * 86400 ))
+end_epoch=$(( now - Y * 86400 ))
 
 # choose output mode
 JSON_OUT=false
@@ -43,14 +57,12 @@ if [ "${3:-}" = "--json" ]; then
 fi
 
 if $JSON_OUT ; then
-  jq --argjson start "$start_epoch" --argjson end "$end_epoch" \
-    '[ .[] | select(.first_installed == true and (.first_installed_epoch >= $start and .first_installed_epoch <= $end)) ]' \
-    "$OUT_JSON"
+  read_index | jq -n --argjson start_epoch "$start_epoch" --argjson end_epoch "$end_epoch" \
+    "[ $ROWS"' | select(.first_installed == true and (.first_installed_epoch >= $start_epoch and .first_installed_epoch <= $end_epoch)) ]'
 else
-  jq -r --argjson start "$start_epoch" --argjson end "$end_epoch" \
-    '.[] | select(.first_installed == true and (.first_installed_epoch >= $start and .first_installed_epoch <= $end)) | 
-      [ (.first_installed_time // "unknown"), .formula, .version, .install_path ] | @tsv' \
-    "$OUT_JSON" | \
+  read_index | jq -rn --argjson start_epoch "$start_epoch" --argjson end_epoch "$end_epoch" \
+    "$ROWS"' | select(.first_installed == true and (.first_installed_epoch >= $start_epoch and .first_installed_epoch <= $end_epoch)) | 
+      [ (.first_installed_time // "unknown"), .formula, .version, .install_path ] | @tsv' | \
   awk -F"\t" '{ printf "%-25s  %-30s  %s\n", $1, $2, $3 }'
 fi
 
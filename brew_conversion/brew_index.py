@@ -3,42 +3,462 @@ import argparse
 import concurrent.futures
 import json
 import os
-import re
+import signal
+import sqlite3
+import struct
 import subprocess
 import sys
+import threading
 import time
+from array import array
 from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import quote
+
+from brew_env import resolve_brew_paths
+from brew_records import InstallRecord, assign_first_installed, format_local_time
+from github_http import GitHubClient, GraphQLError, last_page_from_link, resolve_token
+from index_io import (COMPRESSIONS, FORMATS, SQLITE_INDEX_FILE, TIME_INDEX_MAGIC, index_file_name, iter_object_arrays,
+                      load_json_sidecar, save_json_sidecar, time_index_paths, write_index_file, zstd_available)
+from timings import TIMINGS
 
 def run_cmd(cmd):
+    TIMINGS.count_spawn(cmd)
     try:
         return subprocess.check_output(cmd, shell=True, text=True).strip()
     except subprocess.CalledProcessError:
         return None
 
-def get_iso_time(epoch):
-    # Determine timezone offset
-    if time.localtime(epoch).tm_isdst and time.daylight:
-        tz_offset = -time.altzone
-    else:
-        tz_offset = -time.timezone
+# Sidecar kept next to installs_index.json for --incremental runs.
+# Maps each receipt / cask version dir to its fingerprint and scanned record.
+INDEX_STATE_FILE = "installs_index.state.json"
+INDEX_STATE_VERSION = 1
 
-    tz_hours = tz_offset // 3600
-    tz_minutes = (tz_offset % 3600) // 60
+def load_index_state(state_path):
+    try:
+        return load_json_sidecar(state_path, INDEX_STATE_VERSION)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable index state {state_path}: {e}", file=sys.stderr)
+        return None
 
-    # Python 3.6+ f-string formatting for timezone
-    tz_str = f"{tz_hours:+03d}{tz_minutes:02d}"
+def serialize_index_state(state):
+    # The form load_index_state returns: records as dicts
+    entries = {
+        key: {"fp": e["fp"], "record": e["record"].to_dict()}
+        for key, e in state["entries"].items()
+    }
+    return {"version": state["version"], "entries": entries}
 
-    # Format time
-    dt = datetime.fromtimestamp(epoch)
-    return dt.strftime("%Y-%m-%dT%H:%M:%S") + tz_str
+def save_index_state(state_path, state):
+    try:
+        save_json_sidecar(state_path, serialize_index_state(state))
+    except Exception as e:
+        print(f"Warning: Failed to write index state {state_path}: {e}", file=sys.stderr)
+
+def fingerprint(st):
+    # inode catches replace-by-rename, mtime/size catch in-place rewrites
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+def list_subdirs(root):
+    # Sorted DirEntry list of root's subdirectories (d_type, no extra stat)
+    try:
+        with os.scandir(root) as it:
+            return sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+    except OSError as e:
+        print(f"Error scanning {root}: {e}", file=sys.stderr)
+        return []
+
+def scan_formula_dir(formula_dir):
+    # [(receipt_path, stat, "formula")] for exactly <formula>/<version>/INSTALL_RECEIPT.json
+    found = []
+    for version_dir in list_subdirs(formula_dir):
+        receipt = os.path.join(version_dir.path, "INSTALL_RECEIPT.json")
+        try:
+            found.append((Path(receipt), os.stat(receipt), "formula"))
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"Error processing {receipt}: {e}", file=sys.stderr)
+    return found
+
+def scan_cask_dir(cask_dir):
+    # [(version_dir, stat, "cask")] for <cask>/<version>, skipping .metadata
+    found = []
+    for version_dir in list_subdirs(cask_dir):
+        if version_dir.name == ".metadata":
+            continue
+        try:
+            found.append((Path(version_dir.path), version_dir.stat(), "cask"))
+        except OSError as e:
+            print(f"Error processing {version_dir.path}: {e}", file=sys.stderr)
+    return found
+
+def receipt_record(receipt, st):
+    version_dir = receipt.parent
+    formula_dir = version_dir.parent
+
+    formula = formula_dir.name
+    version = version_dir.name
+
+    mtime_epoch = int(st.st_mtime)
+    mtime_iso = format_local_time(mtime_epoch)
+
+    try:
+        with open(receipt, 'r') as f:
+            data = json.load(f)
+            if 'formula' in data and 'name' in data['formula']:
+                formula = data['formula']['name']
+    except Exception:
+        pass
+
+    return InstallRecord(formula, version, str(receipt), mtime_iso, mtime_epoch)
+
+def cask_record(version_dir, st):
+    mtime_epoch = int(st.st_mtime)
+    mtime_iso = format_local_time(mtime_epoch)
+
+    return InstallRecord(version_dir.parent.name, version_dir.name, str(version_dir),
+                         mtime_iso, mtime_epoch, type="cask")
+
+def build_install_records(cellar, caskroom, prev_state=None, jobs=8, on_record=None):
+    """Scan Cellar and Caskroom into grouped install records.
+
+    Formula and cask directories are scanned and their receipts parsed on a
+    pool of `jobs` threads; results are merged in sorted directory order so
+    the output does not depend on scheduling.
+
+    When prev_state is given, entries whose fingerprint is unchanged reuse the
+    stored record instead of being re-parsed, and first_installed* is only
+    recomputed for (formula, version) groups that gained, lost or changed a
+    member. Returns (records, state); the records are copies, safe to mutate.
+
+    on_record, if given, is called on the main thread with each record as soon
+    as its directory has been scanned, before grouping.
+    """
+    prev_entries = prev_state.get("entries", {}) if prev_state else {}
+    entries = {}
+    dirty_groups = set()
+    reparsed = 0
+
+    def scan(task):
+        # Runs on a worker: [(key, fp, record, previous record dict or None, reparsed)]
+        scan_dir, package_dir = task
+        results = []
+        for path, st, kind in scan_dir(package_dir):
+            key = str(path)
+            fp = fingerprint(st)
+            prev = prev_entries.get(key)
+            if prev and prev["fp"] == fp:
+                results.append((key, fp, InstallRecord.from_dict(prev["record"]), None, False))
+                continue
+            try:
+                rec = receipt_record(path, st) if kind == "formula" else cask_record(path, st)
+            except Exception as e:
+                print(f"Error processing {path}: {e}", file=sys.stderr)
+                continue
+            results.append((key, fp, rec, prev and prev["record"], True))
+        return results
+
+    tasks = []
+    if cellar and os.path.isdir(cellar):
+        tasks += [(scan_formula_dir, e.path) for e in list_subdirs(cellar)]
+    if caskroom and os.path.isdir(caskroom):
+        tasks += [(scan_cask_dir, e.path) for e in list_subdirs(caskroom)]
+
+    with TIMINGS.phase("scan"), concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for results in executor.map(TIMINGS.profiled("scan", scan), tasks):
+            for key, fp, rec, prev_rec, changed in results:
+                entries[key] = {"fp": fp, "record": rec}
+                if on_record:
+                    on_record(rec)
+                if changed:
+                    reparsed += 1
+                    dirty_groups.add(rec.group_key)
+                    if prev_rec:
+                        dirty_groups.add((prev_rec['formula'], prev_rec['version']))
+
+    removed = prev_entries.keys() - entries.keys()
+    for key in removed:
+        rec = prev_entries[key]["record"]
+        dirty_groups.add((rec['formula'], rec['version']))
+
+    records = [e["record"] for e in entries.values()]
+    with TIMINGS.phase("group"):
+        assign_first_installed(records, dirty_groups if prev_state else None)
+    TIMINGS.count("records.scanned", len(records))
+    TIMINGS.count("records.reparsed", reparsed)
+
+    if prev_state:
+        print(f"Incremental scan: {reparsed} changed, {len(removed)} removed, "
+              f"{len(entries) - reparsed} unchanged", file=sys.stderr)
+
+    state = {"version": INDEX_STATE_VERSION, "entries": entries}
+    return [r.copy() for r in records], state
+
+# Sidecar time index for brew_first_installs.py range queries; the layout is in index_io
+def write_time_index(index_path, records):
+    data_path, idx_path = time_index_paths(os.path.dirname(index_path))
+    # sorted() is stable, so equal epochs keep the index's (formula, version) order
+    rows = sorted((r for r in records if r.first_installed),
+                  key=lambda r: r.first_installed_epoch)
+
+    epochs = array('q')
+    offsets = array('q', [0])
+    try:
+        # Both files are renamed into place; readers check the .idx against the index anyway
+        with open(data_path + ".tmp", 'wb') as f:
+            for r in rows:
+                line = json.dumps(r.to_dict(), separators=(",", ":")).encode() + b"\n"
+                f.write(line)
+                epochs.append(r.first_installed_epoch)
+                offsets.append(offsets[-1] + len(line))
+
+        st = os.stat(index_path)
+        with open(idx_path + ".tmp", 'wb') as f:
+            f.write(TIME_INDEX_MAGIC)
+            f.write(struct.pack("<qq", st.st_mtime_ns, st.st_size))
+            epochs.tofile(f)
+            offsets.tofile(f)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(idx_path + ".tmp", idx_path)
+    except Exception as e:
+        print(f"Warning: Failed to write time index {idx_path}: {e}", file=sys.stderr)
+
+# Optional SQLite copy of the index (--sqlite), written next to the index.
+# installs holds every index row (status 'installed' or 'available'); enrichment
+# and available hold the per-formula dates they came from. meta records the
+# (mtime_ns, size) of the JSON index so readers can tell when it's stale.
+SQLITE_SCHEMA = """
+CREATE TABLE installs (
+    formula TEXT NOT NULL,
+    version TEXT NOT NULL,
+    install_path TEXT,
+    install_time TEXT,
+    install_epoch INTEGER,
+    first_installed INTEGER,
+    first_installed_epoch INTEGER,
+    first_installed_time TEXT,
+    type TEXT,
+    status TEXT NOT NULL,
+    repo_first_commit_date TEXT,
+    host TEXT
+);
+CREATE INDEX installs_formula ON installs (formula);
+CREATE INDEX installs_first_installed_epoch ON installs (first_installed_epoch);
+CREATE INDEX installs_status ON installs (status);
+CREATE TABLE enrichment (
+    formula TEXT PRIMARY KEY,
+    repo_first_commit_date TEXT NOT NULL
+);
+CREATE TABLE available (
+    formula TEXT PRIMARY KEY,
+    added_time TEXT NOT NULL,
+    added_epoch INTEGER NOT NULL
+);
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+def write_sqlite_index(index_path, records):
+    db_path = os.path.join(os.path.dirname(index_path), SQLITE_INDEX_FILE)
+    tmp_path = db_path + ".tmp"
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(SQLITE_SCHEMA)
+            conn.executemany(
+                "INSERT INTO installs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (r.as_row() for r in records))
+            conn.executemany(
+                "INSERT OR IGNORE INTO enrichment VALUES (?, ?)",
+                ((r.formula, r.repo_first_commit_date) for r in records
+                 if r.status != 'available' and r.repo_first_commit_date))
+            conn.executemany(
+                "INSERT OR IGNORE INTO available VALUES (?, ?, ?)",
+                ((r.formula, r.install_time, r.install_epoch) for r in records
+                 if r.status == 'available'))
+            st = os.stat(index_path)
+            conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [("index_mtime_ns", st.st_mtime_ns), ("index_size", st.st_size)])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, db_path)
+    except Exception as e:
+        print(f"Warning: Failed to write SQLite index {db_path}: {e}", file=sys.stderr)
+
+# Persistent cache of "oldest commit" lookups, keyed by (tap repo, ruby_source_path).
+# The first commit of a formula file never changes, so hits never expire;
+# negative results ("no commits found") are re-checked after a TTL.
+ENRICH_CACHE_FILE = "installs_index.enrich_cache.json"
+ENRICH_CACHE_VERSION = 1
+ENRICH_CACHE_MAX_ENTRIES = 20000
+ENRICH_CACHE_NEGATIVE_TTL = 7 * 86400
+
+class EnrichmentCache:
+    def __init__(self, path, refresh=False, max_entries=ENRICH_CACHE_MAX_ENTRIES,
+                 negative_ttl=ENRICH_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            data = load_json_sidecar(self.path, ENRICH_CACHE_VERSION)
+            if data is not None:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable enrichment cache {self.path}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _key(repo, path):
+        return f"{repo}:{path}"
+
+    def get(self, repo, path):
+        # Returns (hit, date); date is None for a cached negative result
+        if self.refresh:
+            self.misses += 1
+            return False, None
+        now = int(time.time())
+        with self._lock:
+            entry = self.entries.get(self._key(repo, path))
+            if entry is None or (entry["date"] is None and now - entry["fetched"] > self.negative_ttl):
+                self.misses += 1
+                return False, None
+            entry["used"] = now
+            self.dirty = True
+            self.hits += 1
+            return True, entry["date"]
+
+    def put(self, repo, path, date):
+        now = int(time.time())
+        with self._lock:
+            self.entries[self._key(repo, path)] = {"date": date, "fetched": now, "used": now}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        with self._lock:
+            if len(self.entries) > self.max_entries:
+                # Evict least recently used
+                keep = sorted(self.entries.items(), key=lambda kv: kv[1]["used"], reverse=True)
+                self.entries = dict(keep[:self.max_entries])
+            data = {"version": ENRICH_CACHE_VERSION, "entries": self.entries}
+        try:
+            save_json_sidecar(self.path, data)
+            self.dirty = False
+        except Exception as e:
+            print(f"Warning: Failed to write enrichment cache {self.path}: {e}", file=sys.stderr)
+
+def tap_clone_path(brew_repo, tap_name):
+    # homebrew/core -> <repo>/Library/Taps/homebrew/homebrew-core
+    user, _, repo = tap_name.partition("/")
+    if not brew_repo or not repo:
+        return None
+    return os.path.join(brew_repo, "Library/Taps", user, f"homebrew-{repo}")
+
+def local_first_added_dates(tap_repo):
+    """Map every Formula/ and Casks/ path in a local tap clone to the UTC date it was added.
+
+    One `git log --reverse` pass per tap, so the first sighting of a path is its
+    oldest addition. --no-renames keeps moved files (e.g. the Formula/<letter>/
+    sharding) reported at their current path, like the commits API does.
+    Returns None if the tap is not a full clone.
+    """
+    if not tap_repo or not os.path.isdir(os.path.join(tap_repo, ".git")):
+        return None
+    if run_cmd(f"git -C '{tap_repo}' rev-parse --is-shallow-repository") != "false":
+        return None
+
+    paths = [p + "/" for p in ("Formula", "Casks") if os.path.isdir(os.path.join(tap_repo, p))]
+    if not paths:
+        return None
+
+    cmd = [
+        "git", "-C", tap_repo, "log", "--reverse", "--no-renames",
+        "--diff-filter=A", "--name-only", "--format=DT:%cI", "--"
+    ] + paths
+    try:
+        TIMINGS.count_spawn(cmd)
+        output = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, OSError):
+        print(f"Warning: Failed to read history of {tap_repo}", file=sys.stderr)
+        return None
+
+    dates = {}
+    current_date = None
+    for line in output.splitlines():
+        line = line.strip()
+        if not line: continue
+        if line.startswith("DT:"):
+            # Match the API's committer.date format
+            dt = datetime.fromisoformat(line[3:]).astimezone(timezone.utc)
+            current_date = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+        elif current_date and line not in dates:
+            dates[line] = current_date
+    return dates
+
+# History fields per GraphQL query to start with; halved whenever GitHub refuses one
+GRAPHQL_BATCH_SIZE = 100
+
+def _intern(value):
+    # Tap names repeat across thousands of packages
+    return sys.intern(value) if isinstance(value, str) else value
 
 class Enricher:
-    def __init__(self):
+    def __init__(self, cache=None, client=None, brew_repo=None, offline=False, executor=None):
         self.taps = {}
-        self.installed_info = {}
-        self._load_taps()
+        self.tap_paths = {}  # "Owner/repo" -> local clone dir
+        self.installed_info = {}  # name, full name or alias -> (tap, ruby_source_path)
+        self.cache = cache
+        # GitHubClient for the pooled HTTP path; None falls back to spawning gh
+        self.client = client
+        self.brew_repo = brew_repo
+        # Only use local tap clones, never the network
+        self.offline = offline
+        # Batch remote lookups into GraphQL queries (needs client); falls back to REST
+        self.graphql = False
+        self.graphql_batch_size = GRAPHQL_BATCH_SIZE
+        self.local_history = {}  # "Owner/repo" -> {path: date}, or None if not cloned
+        self._history_locks = {}
+        self._lock = threading.Lock()
+        if executor:
+            # The two brew calls run concurrently, and alongside whatever the caller does next
+            self._pending = [executor.submit(self._load_tap_metadata), executor.submit(self._load_installed_info)]
+        else:
+            self._pending = []
+            self._load_tap_metadata()
+            self._load_installed_info()
+
+    def wait_ready(self):
+        # Blocks until tap and installed metadata are loaded
+        for future in self._pending:
+            future.result()
+
+    def reload_metadata(self):
+        # For an Enricher kept across builds: newly installed packages need fresh
+        # brew metadata, and their taps may have moved on since they were logged
+        self._load_tap_metadata()
         self._load_installed_info()
+        with self._lock:
+            self.local_history = {}
+
+    def _load_tap_metadata(self):
+        with TIMINGS.phase("enrich_metadata"):
+            self._load_taps()
+            self._map_local_taps()
 
     def _load_taps(self):
         # Default mappings for standard taps (since they might not be locally tapped in Brew 4.0)
@@ -62,356 +482,950 @@ class Enricher:
                     if len(parts) >= 2:
                         repo_path = f"{parts[-2]}/{parts[-1]}"
                         self.taps[name] = repo_path
+                        if tap.get("path"):
+                            self.tap_paths[repo_path] = tap["path"]
         except Exception as e:
             print(f"Warning: Failed to load tap info: {e}", file=sys.stderr)
 
+    def _map_local_taps(self):
+        # Taps not reported with a path by tap-info may still be cloned in the standard place
+        for name, repo_path in self.taps.items():
+            if not self.tap_paths.get(repo_path):
+                self.tap_paths[repo_path] = tap_clone_path(self.brew_repo, name)
+
     def _load_installed_info(self):
-        # We need this to get the source path (ruby_source_file)
-        # brew info --json=v2 --installed
-        out = run_cmd("brew info --json=v2 --installed")
-        if not out:
-            return
+        with TIMINGS.phase("enrich_metadata"):
+            self._read_installed_info()
+
+    def _read_installed_info(self):
+        # Only each package's tap and ruby_source_path are needed. They are kept
+        # as one interned (tap, path) tuple per package, shared by its token,
+        # full name and aliases. The JSON is parsed item by item off the pipe,
+        # so neither the document nor its full objects are ever held at once.
+        cmd = ["brew", "info", "--json=v2", "--installed"]
+        TIMINGS.count_spawn(cmd)
+        installed = {}
         try:
-            data = json.loads(out)
-            # Combine formulae and casks
-            items = data.get("formulae", []) + data.get("casks", [])
-            for item in items:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as proc:
                 try:
-                    # Formulae have 'name' and 'full_name'
-                    # Casks have 'token' and 'full_token'
-                    keys = []
-                    if "token" in item: keys.append(item["token"])
-                    if "full_token" in item: keys.append(item["full_token"])
-                    if "name" in item: keys.append(item["name"])
-                    if "full_name" in item: keys.append(item["full_name"])
-
-                    # Filter None and empty strings
-                    keys = [k for k in keys if k and isinstance(k, str)]
-
-                    for k in keys:
-                        self.installed_info[k] = item
-                        # also map aliases if any
-                        aliases = item.get("aliases", [])
-                        if isinstance(aliases, list):
-                            for alias in aliases:
-                                if alias and isinstance(alias, str):
-                                    self.installed_info[alias] = item
-                except Exception:
-                    continue
-
+                    for kind, item in iter_object_arrays(proc.stdout):
+                        if kind not in ("formulae", "casks"):
+                            continue
+                        try:
+                            # Formulae have 'name' and 'full_name', casks 'token' and 'full_token'
+                            keys = [item.get(k) for k in ("token", "full_token", "name", "full_name")]
+                            keys = [k for k in keys if k and isinstance(k, str)]
+                            if not keys:
+                                continue
+                            aliases = item.get("aliases")
+                            if isinstance(aliases, list):
+                                keys += [a for a in aliases if a and isinstance(a, str)]
+                            entry = (_intern(item.get("tap")), item.get("ruby_source_path"))
+                            for k in keys:
+                                installed[k] = entry
+                        except Exception:
+                            continue
+                finally:
+                    proc.stdout.close()  # don't block brew if we stopped reading early
         except Exception as e:
-             print(f"Warning: Failed to load installed info: {e}", file=sys.stderr)
+            print(f"Warning: Failed to load installed info: {e}", file=sys.stderr)
+            return
+        if proc.returncode == 0:
+            self.installed_info = installed
 
     def get_repo_and_path(self, formula_name):
+        self.wait_ready()
         # Try to find installed info
         info = self.installed_info.get(formula_name)
         if not info:
              return None, None
 
-        tap_name = info.get("tap")
+        tap_name, path = info
         repo = self.taps.get(tap_name)
 
-        path = info.get("ruby_source_path")
-
         if repo and path:
             return repo, path
         return None, None
 
     def fetch_oldest_commit_date(self, formula_name):
-        repo, path = self.get_repo_and_path(formula_name)
-        if not repo or not path:
-            return None
+        key, date = self.lookup_without_network(formula_name)
+        if key is None:
+            return date
+        return self.fetch_remote(*key)
 
-        # Use gh api to fetch
-        # Endpoint: /repos/{repo}/commits?path={path}&per_page=1
-        endpoint = f"/repos/{repo}/commits?path={path}&per_page=1"
+    def lookup_without_network(self, formula_name):
+        """Answer from the cache or a local tap clone if possible.
 
+        Returns (None, date) when answered (or unanswerable), or ((repo, path), None)
+        when the date has to come from GitHub.
+        """
+        repo, path = self.get_repo_and_path(formula_name)
+        if not repo or not path:
+            return None, None
+
+        if self.cache:
+            hit, date = self.cache.get(repo, path)
+            if hit:
+                return None, date
+
+        local = self.get_local_history(repo)
+        if local is not None:
+            date = local.get(path)
+            if self.cache:
+                self.cache.put(repo, path, date)
+            return None, date
+        if self.offline:
+            return None, None
+        return (repo, path), None
+
+    def fetch_remote(self, repo, path):
         try:
-            # 1. Get First Page to check headers
-            # gh api -i endpoint
-            cmd = ["gh", "api", "-i", endpoint]
-            output = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL)
-            parts = output.split("\n\n", 1)
-            headers = parts[0]
-
-            # Parse Link header
-            last_page = 1
-            for line in headers.splitlines():
-                if line.lower().startswith("link:"):
-                    # <url>; rel="next", <url>; rel="last"
-                    matches = re.findall(r'<([^>]+)>;\s*rel="([^"]+)"', line)
-                    for url, rel in matches:
-                        if rel == "last":
-                            m = re.search(r'[?&]page=(\d+)', url)
-                            if m:
-                                last_page = int(m.group(1))
-
-            # 2. Fetch Last Page
-            if last_page > 1:
-                endpoint_last = f"{endpoint}&page={last_page}"
-                out_json = subprocess.check_output(["gh", "api", endpoint_last], text=True, stderr=subprocess.DEVNULL)
-                data = json.loads(out_json)
+            if self.client:
+                date = self._http_oldest_commit_date(repo, path)
             else:
-                # Body is parts[1] if parts length > 1 else ...
-                # Easier to just re-fetch body or parse parts[1]
-                body = parts[1] if len(parts) > 1 else "[]"
-                data = json.loads(body)
-
-            if isinstance(data, list) and len(data) > 0:
-                commit = data[-1]
-                return commit['commit']['committer']['date']
-
+                date = self._gh_oldest_commit_date(repo, path)
         except Exception as e:
+            # Transient failures are not cached so the next run retries
             print(f"Debug: fetch failed for {repo}/{path}: {e}", file=sys.stderr)
             return None
 
+        if self.cache:
+            self.cache.put(repo, path, date)
+        return date
+
+    def get_local_history(self, repo):
+        # Computed once per tap on first use; other threads wait for the same tap
+        with self._lock:
+            if repo in self.local_history:
+                return self.local_history[repo]
+            repo_lock = self._history_locks.setdefault(repo, threading.Lock())
+        with repo_lock:
+            with self._lock:
+                if repo in self.local_history:
+                    return self.local_history[repo]
+            history = local_first_added_dates(self.tap_paths.get(repo))
+            if history is not None:
+                print(f"Read {len(history)} first-added dates from local clone of {repo}", file=sys.stderr)
+            with self._lock:
+                self.local_history[repo] = history
+            return history
+
+    def fetch_remote_batch(self, repo, paths):
+        """{path: date} for many paths of one repo, via batched GraphQL queries.
+
+        Paths GraphQL could not answer are fetched one at a time over REST.
+        """
+        dates = {}
+        if self.graphql:
+            try:
+                dates = self._graphql_oldest_commit_dates(repo, paths)
+            except Exception as e:
+                print(f"Debug: GraphQL history lookup failed for {repo}: {e}", file=sys.stderr)
+            if self.cache:
+                for path, date in dates.items():
+                    self.cache.put(repo, path, date)
+        for path in paths:
+            if path not in dates:
+                dates[path] = self.fetch_remote(repo, path)
+        return dates
+
+    def _graphql_oldest_commit_dates(self, repo, paths):
+        # Splits chunks GitHub refuses (502 on oversized queries, resource limits)
+        # and remembers the smaller size; a chunk of one that still fails is left to REST.
+        # Rate limits are not about size: the client already waited them out, and
+        # if they persist the rest of this batch goes to REST, unsplit.
+        dates = {}
+        size = self.graphql_batch_size
+        todo = [paths[i:i + size] for i in range(0, len(paths), size)]
+        while todo and self.graphql:
+            chunk = todo.pop()
+            try:
+                dates.update(self._graphql_history_chunk(repo, chunk))
+            except GraphQLError as e:
+                if e.status in (401, 404) or "NOT_FOUND" in e.types:
+                    # No GraphQL endpoint (or no token); it won't work for later batches either
+                    if e.status in (401, 404):
+                        self.graphql = False
+                    print(f"Debug: GraphQL unavailable for {repo}: {e}", file=sys.stderr)
+                    break
+                if e.status in (403, 429) or "RATE_LIMITED" in e.types:
+                    print(f"Debug: GraphQL still rate limited for {repo} ({e}), using REST for this batch",
+                          file=sys.stderr)
+                    break
+                if len(chunk) == 1:
+                    # Not a size problem; leave this and every later lookup to REST
+                    self.graphql = False
+                    print(f"Debug: GraphQL failed for a single path ({e}), falling back to REST", file=sys.stderr)
+                    break
+                with self._lock:
+                    self.graphql_batch_size = size = max(1, min(self.graphql_batch_size, len(chunk) // 2))
+                print(f"Debug: GraphQL query for {len(chunk)} paths failed ({e}), retrying in chunks of {size}",
+                      file=sys.stderr)
+                todo += [chunk[i:i + size] for i in range(0, len(chunk), size)][::-1]
+        return dates
+
+    def _graphql_history_chunk(self, repo, paths):
+        """Oldest commit dates for `paths` in two round trips.
+
+        The first query asks each path's history for its newest commit, total
+        count and cursor; the second jumps straight to the last commit using
+        GitHub's "<oid> <offset>" cursor format. Paths missing from the result
+        (per-field errors, unexpected cursors) are left to the caller.
+        """
+        owner, name = repo.split("/", 1)
+        first = self._graphql_history_query(owner, name, paths, "totalCount pageInfo { endCursor } nodes { committedDate }")
+        dates = {}
+        last_cursors = {}
+        for i, path in enumerate(paths):
+            history = first.get(f"h{i}")
+            if history is None:
+                continue
+            total = history.get("totalCount") or 0
+            nodes = history.get("nodes") or []
+            if total == 0:
+                dates[path] = None
+            elif total == 1 and nodes:
+                dates[path] = nodes[0]["committedDate"]
+            else:
+                cursor = (history.get("pageInfo") or {}).get("endCursor") or ""
+                oid, _, offset = cursor.rpartition(" ")
+                if oid and offset.isdigit():
+                    last_cursors[path] = f"{oid} {total - 2}"
+
+        if last_cursors:
+            rest = list(last_cursors)
+            last = self._graphql_history_query(owner, name, rest, "nodes { committedDate }",
+                                               [last_cursors[p] for p in rest])
+            for i, path in enumerate(rest):
+                nodes = (last.get(f"h{i}") or {}).get("nodes")
+                if nodes:
+                    dates[path] = nodes[-1]["committedDate"]
+        return dates
+
+    def _graphql_history_query(self, owner, name, paths, fields, cursors=None):
+        # One aliased history(path:) field per path, paths passed as variables
+        params = ["$owner: String!", "$name: String!"]
+        variables = {"owner": owner, "name": name}
+        aliases = []
+        for i, path in enumerate(paths):
+            params.append(f"$p{i}: String!")
+            variables[f"p{i}"] = path
+            after = ""
+            if cursors:
+                params.append(f"$c{i}: String!")
+                variables[f"c{i}"] = cursors[i]
+                after = f", after: $c{i}"
+            aliases.append(f"h{i}: history(path: $p{i}, first: 1{after}) {{ {fields} }}")
+        query = (f"query({', '.join(params)}) {{ repository(owner: $owner, name: $name) {{ "
+                 f"defaultBranchRef {{ target {{ ... on Commit {{ {' '.join(aliases)} }} }} }} }} }}")
+        data, _ = self.client.graphql(query, variables, retry_server_errors=False)
+        repository = data.get("repository")
+        if repository is None:
+            raise GraphQLError(f"repository {owner}/{name} not found", types=["NOT_FOUND"])
+        return ((repository.get("defaultBranchRef") or {}).get("target")) or {}
+
+    def _http_oldest_commit_date(self, repo, path):
+        endpoint = f"/repos/{repo}/commits?path={quote(path)}&per_page=1"
+        data, headers = self.client.get_json(endpoint)
+
+        last_page = last_page_from_link(headers.get("link"))
+        if last_page > 1:
+            data, _ = self.client.get_json(f"{endpoint}&page={last_page}")
+
+        if isinstance(data, list) and len(data) > 0:
+            return data[-1]['commit']['committer']['date']
         return None
 
-def main():
-    parser = argparse.ArgumentParser(description="Index Homebrew installs.")
-    parser.add_argument("--enrich", action="store_true", help="Enrich with history from GitHub")
-    parser.add_argument("--available", action="store_true", help="Index available (non-installed) packages from last year")
-    args = parser.parse_args()
-
-    # 1. Determine Paths
-    brew_repo = run_cmd("brew --repository") or os.path.expanduser("~/.homebrew")
-    cellar = run_cmd("brew --cellar")
-    caskroom = run_cmd("brew --caskroom")
-
-    print(f"Scanning Homebrew Cellar: {cellar}", file=sys.stderr)
-
-    records = []
-
-    # 2. Scan Cellar
-    if cellar and os.path.isdir(cellar):
-        cellar_path = Path(cellar)
-        for receipt in cellar_path.rglob("INSTALL_RECEIPT.json"):
-            try:
-                version_dir = receipt.parent
-                formula_dir = version_dir.parent
+    def _gh_oldest_commit_date(self, repo, path):
+        # Use gh api to fetch
+        # Endpoint: /repos/{repo}/commits?path={path}&per_page=1
+        endpoint = f"/repos/{repo}/commits?path={path}&per_page=1"
 
-                formula = formula_dir.name
-                version = version_dir.name
+        # 1. Get First Page to check headers
+        # gh api -i endpoint
+        cmd = ["gh", "api", "-i", endpoint]
+        TIMINGS.count_spawn(cmd)
+        output = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL)
+        parts = output.split("\n\n", 1)
+        headers = parts[0]
+
+        # Parse Link header
+        last_page = 1
+        for line in headers.splitlines():
+            if line.lower().startswith("link:"):
+                last_page = last_page_from_link(line[5:].strip())
+
+        # 2. Fetch Last Page
+        if last_page > 1:
+            endpoint_last = f"{endpoint}&page={last_page}"
+            TIMINGS.count_spawn(["gh"])
+            out_json = subprocess.check_output(["gh", "api", endpoint_last], text=True, stderr=subprocess.DEVNULL)
+            data = json.loads(out_json)
+        else:
+            # Body is parts[1] if parts length > 1 else ...
+            # Easier to just re-fetch body or parse parts[1]
+            body = parts[1] if len(parts) > 1 else "[]"
+            data = json.loads(body)
+
+        if isinstance(data, list) and len(data) > 0:
+            commit = data[-1]
+            return commit['commit']['committer']['date']
 
-                mtime_epoch = int(receipt.stat().st_mtime)
-                mtime_iso = get_iso_time(mtime_epoch)
+        return None
 
-                try:
-                    with open(receipt, 'r') as f:
-                        data = json.load(f)
-                        if 'formula' in data and 'name' in data['formula']:
-                            formula = data['formula']['name']
-                except Exception:
-                    pass
-
-                records.append({
-                    "formula": formula,
-                    "version": version,
-                    "install_path": str(receipt),
-                    "install_time": mtime_iso,
-                    "install_epoch": mtime_epoch
-                })
-            except Exception as e:
-                print(f"Error processing {receipt}: {e}", file=sys.stderr)
+def list_tap_repos(brew_repo):
+    # Git clones under Library/Taps/<user>/<repo>, in sorted order
+    taps_dir = os.path.join(brew_repo, "Library/Taps")
+    if not os.path.isdir(taps_dir):
+        return []
+    return [
+        tap_repo.path
+        for tap in list_subdirs(taps_dir)  # e.g. homebrew/homebrew-core
+        for tap_repo in list_subdirs(tap.path)
+        if os.path.exists(os.path.join(tap_repo.path, ".git"))
+    ]
+
+# Sidecar for --available: per tap, the HEAD scanned last time, the start of
+# the window it covered and the additions found, so later runs only walk the
+# commits since then. Ignored with --no-cache, rebuilt with --refresh-cache.
+AVAILABLE_STATE_FILE = "installs_index.available_state.json"
+AVAILABLE_STATE_VERSION = 1
+
+def load_available_state(state_path):
+    try:
+        return load_json_sidecar(state_path, AVAILABLE_STATE_VERSION)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable tap scan state {state_path}: {e}", file=sys.stderr)
+        return None
 
-    # 3. Scan Caskroom
-    if caskroom and os.path.isdir(caskroom):
-        caskroom_path = Path(caskroom)
+def save_available_state(state_path, taps):
+    try:
+        save_json_sidecar(state_path, {"version": AVAILABLE_STATE_VERSION, "taps": taps})
+    except Exception as e:
+        print(f"Warning: Failed to write tap scan state {state_path}: {e}", file=sys.stderr)
+
+def tap_scan_paths(tap_repo):
+    return [p + "/" for p in ("Formula", "Casks") if os.path.isdir(os.path.join(tap_repo, p))]
+
+def tap_head_and_window(tap_repo, since):
+    # One git call: HEAD's SHA and `since` as the epoch git log --since compares commit dates to
+    cmd = ["git", "-C", tap_repo, "rev-parse", f"--since={since}", "HEAD"]
+    TIMINGS.count_spawn(cmd)
+    out = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL).split()
+    max_age = next(int(a.split("=", 1)[1]) for a in out if a.startswith("--max-age="))
+    head = next(a for a in out if not a.startswith("-"))
+    return head, max_age
+
+def is_ancestor(tap_repo, old, new):
+    # False also when `old` no longer exists (re-clone) or history was rewritten
+    cmd = ["git", "-C", tap_repo, "merge-base", "--is-ancestor", old, new]
+    TIMINGS.count_spawn(cmd)
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+def scan_tap_additions(tap_repo, since, paths_to_scan, revision="HEAD"):
+    """Map formula/cask names added to a tap since `since` to (add date, commit epoch).
+
+    `revision` is what git log walks, e.g. "<old>..<new>" for just the new
+    commits. Output is parsed line by line as it streams from the pipe:
+        DT:1704067200 2024-01-01T...
+        Formula/foo.rb
+    Log order is newest first, so the first sighting of a name is its latest
+    addition, which is what a "recently added" feed wants. Raises
+    CalledProcessError or OSError if git fails.
+    """
+    cmd = [
+        "git", "-C", tap_repo, "log",
+        "--diff-filter=A", "--name-only", "--format=DT:%ct %aI",
+        f"--since={since}", revision, "--"
+    ] + paths_to_scan
+
+    added = {}
+    TIMINGS.count_spawn(cmd)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+        current = None
+        for line in proc.stdout:
+            line = line.strip()
+            if not line: continue
+            if line.startswith("DT:"):
+                commit_epoch, date_iso = line[3:].split(" ", 1)
+                current = (date_iso, int(commit_epoch))
+            elif current:
+                # Formula/foo.rb -> foo
+                name = Path(line).stem
+                if name not in added:
+                    added[name] = current
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return added
+
+def scan_tap(tap_repo, since, prev=None):
+    """Additions to one tap within the window, reusing `prev` (its saved state) when possible.
+
+    Returns (added, state): added maps name -> (add date, commit epoch), and
+    state is what to save for the next run (None if nothing can be saved).
+    With prev for the same HEAD, nothing is walked; for an older HEAD that is
+    still an ancestor, only prev..HEAD is. Saved additions whose commit has
+    aged out of the window are dropped. A rewritten history, a re-clone, a
+    wider window or new Formula/Casks dirs mean a full scan.
+    """
+    paths = tap_scan_paths(tap_repo)
+    if not paths:
+        return {}, None
+    try:
         try:
-            for cask_dir in caskroom_path.iterdir():
-                if not cask_dir.is_dir():
-                    continue
-                for version_dir in cask_dir.iterdir():
-                    if not version_dir.is_dir():
-                        continue
-
-                    if version_dir.name == ".metadata":
-                        continue
-
-                    cask = cask_dir.name
-                    version = version_dir.name
-
-                    mtime_epoch = int(version_dir.stat().st_mtime)
-                    mtime_iso = get_iso_time(mtime_epoch)
-
-                    records.append({
-                        "formula": cask,
-                        "version": version,
-                        "install_path": str(version_dir),
-                        "install_time": mtime_iso,
-                        "install_epoch": mtime_epoch,
-                        "type": "cask"
-                    })
-        except Exception as e:
-            print(f"Error processing Casks in {caskroom}: {e}", file=sys.stderr)
-
-    # 4. Process Data (Grouping and First Installed)
-    groups = {}
-    for r in records:
-        key = f"{r['formula']}||{r['version']}"
-        if key not in groups:
-            groups[key] = []
-        groups[key].append(r)
-
-    final_records = []
-
-    for key, group in groups.items():
-        min_epoch = min(item['install_epoch'] for item in group)
-        min_iso = get_iso_time(min_epoch)
-
-        for item in group:
-            item['first_installed_epoch'] = min_epoch
-            item['first_installed_time'] = min_iso
-            item['first_installed'] = (item['install_epoch'] == min_epoch)
-            final_records.append(item)
-
-    # 5. Optional Enrichment
-    if args.enrich:
+            head, max_age = tap_head_and_window(tap_repo, since)
+        except (subprocess.CalledProcessError, StopIteration, ValueError):
+            # No HEAD, or a date git does not understand here: scan without saving
+            return scan_tap_additions(tap_repo, since, paths), None
+
+        if (prev and prev.get("paths") == paths and prev.get("since_epoch", max_age + 1) <= max_age
+                and prev.get("head") and (prev["head"] == head or is_ancestor(tap_repo, prev["head"], head))):
+            TIMINGS.count("available.taps_incremental")
+            added = {}
+            if prev["head"] != head:
+                added = scan_tap_additions(tap_repo, since, paths, f"{prev['head']}..{head}")
+            for name, (date_iso, commit_epoch) in prev.get("added", {}).items():
+                if commit_epoch >= max_age and name not in added:
+                    added[name] = (date_iso, commit_epoch)
+        else:
+            TIMINGS.count("available.taps_full")
+            added = scan_tap_additions(tap_repo, since, paths, head)
+    except (subprocess.CalledProcessError, OSError):
+        print(f"Warning: Failed to scan tap {os.path.basename(tap_repo)}", file=sys.stderr)
+        return {}, None
+    return added, {"head": head, "since_epoch": max_age, "paths": paths, "added": added}
+
+def scan_available(brew_repo, since, jobs=8, state_path=None, refresh=False):
+    """Map names added to any tap since `since` to their add date.
+
+    With state_path, each tap's scan state is read from and saved to that
+    file, so unchanged taps cost one `git rev-parse` and moved ones only walk
+    their new commits (see scan_tap). refresh ignores the saved state.
+    """
+    # Taps are scanned concurrently; merging in tap order keeps the result deterministic
+    available_map = {}
+    tap_repos = list_tap_repos(brew_repo)
+    prev_taps = {}
+    if state_path and not refresh:
+        prev_taps = (load_available_state(state_path) or {}).get("taps", {})
+    taps = {}
+    if tap_repos:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(tap_repos)))) as executor:
+            scan_one = TIMINGS.profiled("available", lambda t: scan_tap(t, since, prev_taps.get(t)))
+            results = executor.map(scan_one, tap_repos)
+            for tap_repo, (added, tap_state) in zip(tap_repos, results):
+                if tap_state is not None:
+                    taps[tap_repo] = tap_state
+                for name, (date_iso, _) in added.items():
+                    if name not in available_map:
+                        available_map[name] = date_iso
+    if state_path and (taps or prev_taps):
+        save_available_state(state_path, taps)
+    return available_map
+
+class EnrichmentMemo:
+    """What --watch keeps between rebuilds so --enrich only looks up new formulae.
+
+    enricher holds the brew metadata loaded for the installed `names`; history
+    maps every formula looked up so far to its date, or None if none was found.
+    """
+    def __init__(self):
+        self.enricher = None
+        self.names = set()
+        self.history = {}
+
+class EnrichmentPipeline:
+    """--enrich, run alongside the Cellar scan instead of after it.
+
+    Creating it starts loading tap and installed metadata (and resolving the
+    GitHub token) on `background`. add() queues a formula's history lookup as
+    soon as the scan yields one of its records; lookups wait for the metadata
+    and run at most args.enrich_concurrency at a time. With GraphQL, lookups
+    that need the network are queued per repo and sent in batches of
+    enricher.graphql_batch_size paths. finish() waits for the rest and
+    applies the dates.
+
+    With a memo from an earlier build, its enricher and dates are reused:
+    finish() only looks up formulae the memo has not seen, and reloads the
+    brew metadata only if they are not among the names it was loaded for.
+    """
+    def __init__(self, brew_repo, args, background, memo=None):
         print("Enriching with GitHub history (this may take a while)...", file=sys.stderr)
-        enricher = Enricher()
-        print(f"Loaded {len(enricher.taps)} taps and {len(enricher.installed_info)} installed info records", file=sys.stderr)
-
-        unique_formulas = set(r['formula'] for r in final_records)
-        print(f"Processing {len(unique_formulas)} unique formulas for enrichment", file=sys.stderr)
-
-        history_map = {}
-
-        # Run concurrently
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_formula = {executor.submit(enricher.fetch_oldest_commit_date, f): f for f in unique_formulas}
-            for future in concurrent.futures.as_completed(future_to_formula):
-                form = future_to_formula[future]
+        self.memo = memo
+        self.client = None
+        self._args = args
+        self._background = background
+        # Reusing: nothing is looked up until finish() knows whether the metadata is current
+        self._reuse = memo is not None and memo.enricher is not None
+        if self._reuse:
+            self.enricher = memo.enricher
+            self.cache = self.enricher.cache
+            self._client_ready = None
+        else:
+            self.cache = None
+            if not args.no_cache:
+                self.cache = EnrichmentCache(os.path.join(brew_repo, ENRICH_CACHE_FILE), refresh=args.refresh_cache)
+            self.enricher = Enricher(cache=self.cache, brew_repo=brew_repo, offline=args.offline, executor=background)
+            self._client_ready = background.submit(self._connect, args)
+        self._known = memo.history if memo is not None else {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.enrich_concurrency))
+        self._futures = {}  # formula -> Future of (date, (repo, path) if batched else None)
+        self._lock = threading.Lock()
+        self._queued = {}  # repo -> paths waiting for a GraphQL batch
+        self._batches = []  # Futures of (repo, {path: date})
+
+    def _connect(self, args):
+        # `gh auth token` may spawn gh, so this runs in the background too
+        if args.transport == "gh" or args.offline:
+            return
+        token = resolve_token(count_spawn=TIMINGS.count_spawn)
+        if token or args.transport in ("http", "graphql"):
+            self.client = GitHubClient(token=token, max_concurrency=args.enrich_concurrency)
+            self.enricher.client = self.client
+            self.enricher.graphql = args.transport != "http"
+
+    def _fetch(self, formula):
+        self._client_ready.result()
+        if not self.enricher.graphql:
+            return self.enricher.fetch_oldest_commit_date(formula), None
+        key, date = self.enricher.lookup_without_network(formula)
+        if key is not None:
+            self._queue(*key)
+        return date, key
+
+    def _queue(self, repo, path):
+        with self._lock:
+            paths = self._queued.setdefault(repo, [])
+            if path in paths:
+                return
+            paths.append(path)
+            if len(paths) >= self.enricher.graphql_batch_size:
+                self._submit_batch(repo, self._queued.pop(repo))
+
+    def _submit_batch(self, repo, paths):
+        fetch = TIMINGS.profiled("enrich_fetch", lambda: (repo, self.enricher.fetch_remote_batch(repo, paths)))
+        self._batches.append(self._executor.submit(fetch))
+
+    def add(self, record):
+        if not self._reuse and record.formula not in self._futures and record.formula not in self._known:
+            fetch = TIMINGS.profiled("enrich_fetch", self._fetch)
+            self._futures[record.formula] = self._executor.submit(fetch, record.formula)
+
+    def _refresh_memo(self, final_records):
+        # Reload metadata only for names it was not loaded for; connect only if there is work
+        names = {r.formula for r in final_records}
+        if names - self._known.keys():
+            if not names <= self.memo.names:
+                self.enricher.reload_metadata()
+                self.memo.names = names
+            self._client_ready = self._background.submit(self._connect, self._args)
+        self._reuse = False
+
+    def finish(self, final_records):
+        if self._reuse:
+            self._refresh_memo(final_records)
+        for r in final_records:
+            self.add(r)
+        self.enricher.wait_ready()
+        if self._client_ready:
+            self._client_ready.result()
+        print(f"Loaded {len(self.enricher.taps)} taps and {len(self.enricher.installed_info)} installed info records", file=sys.stderr)
+        print(f"Processing {len(self._futures)} unique formulas for enrichment", file=sys.stderr)
+
+        results = {}  # formula -> (date, key) or an exception
+        remote = {}  # (repo, path) -> date, from GraphQL batches
+        formula_of = {future: form for form, future in self._futures.items()}
+        # Only the part of the fetch that did not overlap the scan is timed here
+        with TIMINGS.phase("enrich_fetch"):
+            for future in concurrent.futures.as_completed(formula_of):
+                try:
+                    results[formula_of[future]] = future.result()
+                except Exception as e:
+                    results[formula_of[future]] = e
+            # Every lookup has been queued by now; send the partial batches
+            with self._lock:
+                for repo, paths in self._queued.items():
+                    self._submit_batch(repo, paths)
+                self._queued = {}
+            for future in concurrent.futures.as_completed(self._batches):
                 try:
-                    date = future.result()
-                    if date:
-                        history_map[form] = date
-                        print(f"Found history for {form}: {date}", file=sys.stderr)
-                    else:
-                        print(f"No history found for {form}", file=sys.stderr)
+                    repo, dates = future.result()
                 except Exception as e:
-                    print(f"Error fetching history for {form}: {e}", file=sys.stderr)
+                    print(f"Error fetching batched history: {e}", file=sys.stderr)
+                    continue
+                for path, date in dates.items():
+                    remote[(repo, path)] = date
+        self.close()
+
+        history_map = {}
+        for form, result in results.items():
+            if isinstance(result, Exception):
+                print(f"Error fetching history for {form}: {result}", file=sys.stderr)
+                continue
+            date, key = result
+            if key is not None:
+                date = remote.get(key)
+            if date:
+                history_map[form] = date
+                print(f"Found history for {form}: {date}", file=sys.stderr)
+            else:
+                print(f"No history found for {form}", file=sys.stderr)
+            if self.memo is not None:
+                self.memo.history[form] = date or None
+        if self.memo is not None and self.memo.enricher is None:
+            self.memo.enricher = self.enricher
+            self.memo.names = {r.formula for r in final_records}
 
         print(f"Enrichment complete. Found history for {len(history_map)} formulas.", file=sys.stderr)
+        if self.client:
+            TIMINGS.count("github.requests", self.client.requests)
+            TIMINGS.count("github.retries", self.client.retries)
+            print(f"GitHub HTTP: {self.client.requests} requests, {self.client.retries} retries", file=sys.stderr)
+        if self.cache:
+            self.cache.save()
+            TIMINGS.count("cache.hits", self.cache.hits)
+            TIMINGS.count("cache.misses", self.cache.misses)
+            print(f"Enrichment cache: {self.cache.hits} hits, {self.cache.misses} misses", file=sys.stderr)
 
         # Apply to records
         for r in final_records:
-            if r['formula'] in history_map:
-                r['repo_first_commit_date'] = history_map[r['formula']]
-
-    # 6. Available Packages (News Feed)
-    if args.available and brew_repo:
-        print("Scanning for available packages added in the last year...", file=sys.stderr)
-        # Scan Taps
-        taps_dir = Path(brew_repo) / "Library/Taps"
-        available_map = {} # formula -> date_iso
-
-        if taps_dir.is_dir():
-            for tap in taps_dir.iterdir(): # e.g. homebrew/homebrew-core
-               if not tap.is_dir(): continue
-               for tap_repo in tap.iterdir():
-                   if not tap_repo.is_dir() or not (tap_repo / ".git").exists():
-                       continue
-
-                   # Build paths to scan (check if they exist)
-                   paths_to_scan = []
-                   for p in ["Formula", "Casks"]:
-                       if (tap_repo / p).is_dir():
-                           paths_to_scan.append(p + "/")
-
-                   if not paths_to_scan:
-                       continue
-
-                   # Run git log
-                   # git log --diff-filter=A --name-only ... -- paths
-                   cmd = [
-                       "git", "-C", str(tap_repo), "log",
-                       "--diff-filter=A", "--name-only", "--format=DT:%aI",
-                       "--since=1 year ago", "--"
-                   ] + paths_to_scan
-
-                   try:
-                        # We need to capture output and parse
-                        # Output format:
-                        # DT:2024-01-01T...
-                        # Formula/foo.rb
-                        # ...
-                        output = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL)
-                        current_date = None
-                        for line in output.splitlines():
-                            line = line.strip()
-                            if not line: continue
-                            if line.startswith("DT:"):
-                                current_date = line[3:]
-                            elif current_date:
-                                # It's a file path
-                                # Formula/foo.rb -> foo
-                                name = Path(line).stem
-                                # Prefer oldest date if we see it multiple times (unlikely with A filter but possible if renamed/deleted/added)
-                                # Actually diff-filter=A means Added.
-                                # If we see it, it is an addition.
-                                # Use the most recent addition? Or oldest?
-                                # News feed usually wants "New", so "Recently Added".
-                                # If added multiple times (deleted/added), usually we want the latest addition for "News" or oldest for "History"?
-                                # User said: "packages that were recently added... never-before been part of ... system"
-                                # Let's stick to the log order (reverse chronological usually default).
-                                # So first occurrence in log is most recent.
-                                # But we want to show it.
-                                # Let's store the date.
-                                if name not in available_map:
-                                    available_map[name] = current_date
-
-                   except subprocess.CalledProcessError:
-                       print(f"Warning: Failed to scan tap {tap_repo.name}", file=sys.stderr)
-
-        print(f"Found {len(available_map)} recently added packages.", file=sys.stderr)
-
-        # Merge into final_records
-        # Use set of installed names to avoid duplicates
-        installed_names = set(r['formula'] for r in final_records)
-
-        for name, date_iso in available_map.items():
-            if name in installed_names:
-                # Already installed.
-                # We could potentially update repo_first_commit_date if missing, but 'enrich' does that better with full history.
-                # 'available' scan is limited to 1 year.
-                continue
+            date = history_map.get(r.formula) or self._known.get(r.formula)
+            if date:
+                r.repo_first_commit_date = date
+
+    def close(self):
+        # Also called on error paths; drops lookups that have not started
+        self._executor.shutdown(cancel_futures=True)
+        if self._client_ready:
+            self._client_ready.result()
+        if self.client:
+            self.client.close()
+
+def load_available(brew_repo, args):
+    with TIMINGS.phase("available"):
+        print(f"Scanning for available packages added since {args.since}...", file=sys.stderr)
+        state_path = None if args.no_cache else os.path.join(brew_repo, AVAILABLE_STATE_FILE)
+        return scan_available(brew_repo, args.since, jobs=args.jobs, state_path=state_path,
+                              refresh=args.refresh_cache) # formula -> date_iso
+
+def add_available_records(final_records, available_map):
+    print(f"Found {len(available_map)} recently added packages.", file=sys.stderr)
+
+    # Merge into final_records
+    # Use set of installed names to avoid duplicates
+    installed_names = set(r.formula for r in final_records)
+
+    for name, date_iso in available_map.items():
+        if name in installed_names:
+            # Already installed.
+            # We could potentially update repo_first_commit_date if missing, but 'enrich' does that better with full history.
+            # 'available' scan is limited to the --since window.
+            continue
+
+        # Add new record
+        # We need an epoch for filtering in brew_first_installs.py
+        try:
+            # date_iso is ISO 8601
+            # python 3.7+ fromisoformat handle it?
+            # git log %aI is strict ISO 8601
+            dt = datetime.fromisoformat(date_iso)
+            epoch = int(dt.timestamp())
+
+            final_records.append(InstallRecord(
+                name, "N/A", "", date_iso, epoch,
+                first_installed=True, # So it passes the filter "first_installed == true"
+                first_installed_epoch=epoch,
+                first_installed_time=date_iso,
+                repo_first_commit_date=date_iso,
+                status="available"
+            ))
+        except ValueError:
+            pass
 
-            # Add new record
-            # We need an epoch for filtering in brew_first_installs.py
-            try:
-                # date_iso is ISO 8601
-                # python 3.7+ fromisoformat handle it?
-                # git log %aI is strict ISO 8601
-                dt = datetime.fromisoformat(date_iso)
-                epoch = int(dt.timestamp())
-
-                final_records.append({
-                    "formula": name,
-                    "version": "N/A",
-                    "install_path": "",
-                    "install_time": date_iso,
-                    "install_epoch": epoch,
-                    "first_installed": True, # So it passes the filter "first_installed == true"
-                    "first_installed_epoch": epoch,
-                    "first_installed_time": date_iso,
-                    "repo_first_commit_date": date_iso,
-                    "status": "available"
-                })
-            except ValueError:
-                pass
-
-
-    # 7. Output
-    out_json = os.path.join(brew_repo, "installs_index.json")
-    final_records.sort(key=lambda x: (x['formula'], x['version'], x['install_epoch']))
+def main():
+    if sys.argv[1:2] == ["merge"]:
+        from index_merge import merge_main
+        sys.exit(merge_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["diff"]:
+        from index_diff import diff_main
+        sys.exit(diff_main(sys.argv[2:]))
+
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.compress == "zstd" and not zstd_available():
+        parser.error("--compress zstd needs Python 3.14+ or the zstandard package")
+
+    TIMINGS.profile_phase = args.profile
+    TIMINGS.profile_out = args.profile_out
+    try:
+        run_index(args)
+    finally:
+        if args.timings:
+            TIMINGS.write(args.timings)
+
+def build_parser():
+    # Also the source of Indexer's option defaults
+    parser = argparse.ArgumentParser(description="Index Homebrew installs.",
+                                     epilog="Subcommands: brew_index.py merge (indexes from several machines), "
+                                            "brew_index.py diff (changes between two indexes); see their --help")
+    parser.add_argument("--enrich", action="store_true", help="Enrich with history from GitHub")
+    parser.add_argument("--available", action="store_true", help="Index available (non-installed) packages added since --since")
+    parser.add_argument("--since", default="1 year ago", help="How far back --available looks, in any git date format (default: '1 year ago')")
+    parser.add_argument("--transport", choices=["auto", "graphql", "http", "gh"], default="auto",
+                        help="How --enrich talks to GitHub: batched GraphQL queries, pooled REST client, or one gh process per request (auto: graphql when a token is available)")
+    parser.add_argument("--enrich-concurrency", type=int, default=8, help="Maximum concurrent GitHub requests during --enrich")
+    parser.add_argument("--offline", action="store_true", help="Enrich only from locally cloned taps, without contacting GitHub")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the enrichment cache and the --available tap scan state (neither read nor write them)")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Ignore cached enrichment results and saved tap scan state, and rebuild them")
+    parser.add_argument("--sqlite", action="store_true", help="Also write the index to installs_index.sqlite")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="Index file format: indented JSON (default), compact JSON, or NDJSON (installs_index.ndjson)")
+    parser.add_argument("--compress", choices=COMPRESSIONS, default="none",
+                        help="Compress the index file (.gz or .zst suffix); zstd needs Python 3.14+ or the zstandard package")
+    parser.add_argument("--jobs", type=int, default=8, help="Threads for scanning the Cellar, Caskroom and taps")
+    parser.add_argument("--incremental", action="store_true", help="Only re-read receipts and cask dirs that changed since the last run")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running: update the index as the Cellar, Caskroom and taps change, and answer queries on a Unix socket")
+    parser.add_argument("--watch-interval", type=float, default=2.0,
+                        help="Seconds between scans when --watch has to poll (no inotify)")
+    parser.add_argument("--timings", nargs="?", const="-", metavar="FILE",
+                        help="Write a JSON report of per-phase wall/CPU time and counters to FILE (default: stderr)")
+    parser.add_argument("--profile", metavar="PHASE", help="Run one phase (e.g. scan, enrich_fetch, write) under cProfile")
+    parser.add_argument("--profile-out", metavar="FILE", help="Where --profile writes its stats (default: brew_index.<PHASE>.prof)")
+    return parser
+
+def run_index(args):
+    # 1. Determine Paths
+    with TIMINGS.phase("brew_paths"):
+        paths = resolve_brew_paths(count_spawn=TIMINGS.count_spawn)
+        brew_repo = paths["repository"] or os.path.expanduser("~/.homebrew")
+
+    if args.watch:
+        watch_index(args, brew_repo, paths["cellar"], paths["caskroom"])
+        return
 
+    state_path = os.path.join(brew_repo, INDEX_STATE_FILE)
+    prev_state = load_index_state(state_path) if args.incremental else None
+    final_records, index_state, _ = build_index(args, brew_repo, paths["cellar"], paths["caskroom"], prev_state)
     try:
-        with open(out_json, 'w') as f:
-            json.dump(final_records, f, indent=2, sort_keys=True)
-        print(f"Index created: {out_json}")
+        index_path = write_index(args, brew_repo, final_records, index_state)
+        print(f"Index created: {index_path}")
     except Exception as e:
-        print(f"Error writing output to {out_json}: {e}", file=sys.stderr)
+        print(f"Error writing output to {os.path.join(brew_repo, index_file_name(args.format, args.compress))}: {e}",
+              file=sys.stderr)
+        sys.exit(1)
+
+def build_index(args, brew_repo, cellar, caskroom, prev_state=None, available_map=None, memo=None):
+    """Scan, enrich and add available packages. Returns (records, state, available_map).
+
+    available_map, if given, is reused instead of re-scanning the taps for --available.
+    memo (an EnrichmentMemo) carries --enrich metadata and dates from one build to the next.
+    """
+    # Everything here is a small dependency graph, run as futures:
+    #   brew tap-info, brew info --installed, token  -> enrichment lookups
+    #   Cellar/Caskroom scan (per formula)           -> enrichment lookups
+    #   tap git logs                                 -> available records
+    # so the brew and git subprocesses overlap the filesystem scan.
+    enrichment = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as background:
+        try:
+            # 6a. Available Packages (News Feed), only merged after the scan
+            available = None
+            if args.available and brew_repo and available_map is None:
+                available = background.submit(load_available, brew_repo, args)
+
+            # 5a. Optional Enrichment: metadata starts loading now
+            if args.enrich:
+                enrichment = EnrichmentPipeline(brew_repo, args, background, memo)
+
+            # 2-4. Scan Cellar and Caskroom, then group for first-installed
+            print(f"Scanning Homebrew Cellar: {cellar}", file=sys.stderr)
+            final_records, index_state = build_install_records(
+                cellar, caskroom, prev_state, jobs=args.jobs,
+                on_record=enrichment.add if enrichment else None)
+
+            # 5b. Wait for the remaining lookups
+            if enrichment:
+                enrichment.finish(final_records)
+
+            # 6b.
+            if available:
+                available_map = available.result()
+            if args.available and available_map is not None:
+                add_available_records(final_records, available_map)
+        except BaseException:
+            if enrichment:
+                enrichment.close()
+            raise
+    return final_records, index_state, available_map
+
+def write_index(args, brew_repo, final_records, index_state):
+    # 7. Output; sorts final_records in place and returns the index path
+    TIMINGS.count("records.output", len(final_records))
+
+    with TIMINGS.phase("write"):
+        final_records.sort(key=InstallRecord.sort_key)
+        index_path = write_index_file(brew_repo, final_records, args.format, args.compress)
+        write_time_index(index_path, final_records)
+        if args.sqlite:
+            write_sqlite_index(index_path, final_records)
+        if args.incremental and index_state is not None:
+            save_index_state(os.path.join(brew_repo, INDEX_STATE_FILE), index_state)
+    return index_path
+
+class Indexer:
+    """brew-index as a library, for long-running callers that would otherwise spawn it.
+
+        indexer = Indexer(enrich=True, available=True, incremental=True)
+        indexer.build()          # or scan(), enrich(), scan_available() one by one
+        path = indexer.write()
+
+    Options are the command-line flags by their argparse names (enrich,
+    available, since, transport, offline, no_cache, format, compress, sqlite,
+    jobs, incremental, ...), with the same defaults. Paths default to what
+    brew_env resolves. The records stay in memory on `records` between calls,
+    and with incremental=True each scan() reuses the previous one's state, so
+    repeated scans only re-read what changed.
+    """
+    def __init__(self, brew_repo=None, cellar=None, caskroom=None, **options):
+        self.args = build_parser().parse_args([])
+        for name, value in options.items():
+            if not hasattr(self.args, name):
+                raise TypeError(f"Indexer got an unknown option {name!r}")
+            setattr(self.args, name, value)
+        if brew_repo is None or (cellar is None and caskroom is None):
+            paths = resolve_brew_paths(count_spawn=TIMINGS.count_spawn)
+            brew_repo = brew_repo or paths["repository"] or os.path.expanduser("~/.homebrew")
+            if cellar is None and caskroom is None:
+                cellar, caskroom = paths["cellar"], paths["caskroom"]
+        self.brew_repo, self.cellar, self.caskroom = brew_repo, cellar, caskroom
+        self.records = []
+        self.state = None
+        self.available_map = None
+
+    def _prev_state(self):
+        if not self.args.incremental:
+            return None
+        if self.state is not None:
+            return serialize_index_state(self.state)
+        return load_index_state(os.path.join(self.brew_repo, INDEX_STATE_FILE))
+
+    def build(self):
+        """scan(), enrich() and scan_available() as options select, overlapped as the CLI runs them."""
+        self.records, self.state, self.available_map = build_index(
+            self.args, self.brew_repo, self.cellar, self.caskroom, self._prev_state())
+        return self.records
+
+    def scan(self):
+        """Scan the Cellar and Caskroom; replaces `records`, dropping any enrichment or available rows."""
+        print(f"Scanning Homebrew Cellar: {self.cellar}", file=sys.stderr)
+        self.records, self.state = build_install_records(
+            self.cellar, self.caskroom, self._prev_state(), jobs=self.args.jobs)
+        return self.records
+
+    def enrich(self):
+        """Add repo_first_commit_date to the scanned (installed) records."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as background:
+            pipeline = EnrichmentPipeline(self.brew_repo, self.args, background)
+            try:
+                pipeline.finish([r for r in self.records if r.status != "available"])
+            except BaseException:
+                pipeline.close()
+                raise
+        return self.records
+
+    def scan_available(self, refresh=False):
+        """Add records for packages recently added to the taps; the tap scan is reused unless refresh."""
+        if self.available_map is None or refresh:
+            self.available_map = load_available(self.brew_repo, self.args)
+        self.records = [r for r in self.records if r.status != "available"]
+        add_available_records(self.records, self.available_map)
+        return self.records
+
+    def write(self):
+        """Write the index and its sidecars; returns the index path."""
+        return write_index(self.args, self.brew_repo, self.records, self.state)
+
+def watch_index(args, brew_repo, cellar, caskroom):
+    """--watch: build the index, then keep it current and answer queries until interrupted.
+
+    Each change under the Cellar or Caskroom is applied as an incremental
+    rebuild from the in-memory state; the taps are only re-scanned (for
+    --available) when one of them changes, and --enrich only looks up formulae
+    it has not seen before. The index files are rewritten too, so readers that
+    don't use the socket stay current.
+    """
+    # Imported here so one-shot runs don't pay for the socket server
+    from brew_watch import SOCKET_FILE, LiveIndex, QueryServer, claim_socket, make_watcher
+
+    socket_path = os.path.join(brew_repo, SOCKET_FILE)
+    try:
+        claim_socket(socket_path)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
+    state_path = os.path.join(brew_repo, INDEX_STATE_FILE)
+    state = load_index_state(state_path) if args.incremental else None
+    memo = EnrichmentMemo() if args.enrich else None
+    records, state, available_map = build_index(args, brew_repo, cellar, caskroom, state, memo=memo)
+    print(f"Index created: {write_index(args, brew_repo, records, state)}")
+    live = LiveIndex()
+    live.replace(records)
+
+    def watch_sources():
+        # Kegs are Cellar/<formula>/<version>, casks Caskroom/<cask>/<version>
+        sources = [(d, 2, "installs") for d in (cellar, caskroom) if d and os.path.isdir(d)]
+        if args.available:
+            sources.append((os.path.join(brew_repo, "Library/Taps"), 1, "taps"))
+            for tap_repo in list_tap_repos(brew_repo):
+                # git updates HEAD, refs and packed-refs by renaming lock files into place
+                sources += [(os.path.join(tap_repo, ".git"), 0, "taps"),
+                            (os.path.join(tap_repo, ".git", "refs", "heads"), 0, "taps")]
+        return sources
+
+    sources = watch_sources()
+    watcher = make_watcher(sources, args.watch_interval)
+
+    server = QueryServer(socket_path, live.answer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    how = "inotify" if type(watcher).__name__ == "InotifyWatcher" else f"polling every {args.watch_interval}s"
+    print(f"Watching {', '.join(p for p, _, kind in sources if kind == 'installs')} ({how}); "
+          f"answering queries on {socket_path}", file=sys.stderr)
+
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            print(f"Change in {', '.join(sorted(changed))}; updating index", file=sys.stderr)
+            try:
+                records, new_state, new_available = build_index(
+                    args, brew_repo, cellar, caskroom, serialize_index_state(state),
+                    available_map=None if "taps" in changed else available_map, memo=memo)
+                print(f"Index created: {write_index(args, brew_repo, records, new_state)}")
+            except Exception as e:
+                print(f"Error updating index: {e}", file=sys.stderr)
+                continue
+            state, available_map = new_state, new_available
+            live.replace(records)
+            if "taps" in changed:
+                # Taps may have been added or removed
+                watcher.close()
+                watcher = make_watcher(watch_sources(), args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        watcher.close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+
 if __name__ == "__main__":
     main()
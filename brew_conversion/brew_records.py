@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Shared install-record model for brew_index.py and brew_first_installs.py.
+
+InstallRecord is a __slots__ class whose field order matches the columns of the
+SQLite `installs` table, so rows map straight onto records (host_first_installed,
+which only fleet indexes carry, comes last and is not stored there). to_dict()
+produces the exact JSON shape of installs_index.json (keys sorted, optional keys
+only when set).
+
+Run `python3 brew_records.py [N]` to benchmark the record pipeline against the
+original dict-based one (default N = 100000).
+"""
+import sys
+import time
+from datetime import datetime
+
+# Suffix like "+0100" per UTC offset in seconds; only a handful ever exist
+_tz_suffixes = {}
+
+def format_local_time(epoch):
+    """Local-time ISO string, e.g. 2024-01-01T09:30:00+0100.
+
+    Same output as the indexer's original get_iso_time, but with a single
+    localtime() call and the offset suffix memoized per UTC offset.
+    """
+    lt = time.localtime(epoch)
+    if lt.tm_isdst and time.daylight:
+        tz_offset = -time.altzone
+    else:
+        tz_offset = -time.timezone
+
+    tz_str = _tz_suffixes.get(tz_offset)
+    if tz_str is None:
+        tz_hours = tz_offset // 3600
+        tz_minutes = (tz_offset % 3600) // 60
+        tz_str = _tz_suffixes[tz_offset] = f"{tz_hours:+03d}{tz_minutes:02d}"
+
+    return time.strftime("%Y-%m-%dT%H:%M:%S", lt) + tz_str
+
+class InstallRecord:
+    __slots__ = (
+        "formula", "version", "install_path", "install_time", "install_epoch",
+        "first_installed", "first_installed_epoch", "first_installed_time",
+        "type", "status", "repo_first_commit_date", "host", "host_first_installed",
+    )
+
+    def __init__(self, formula, version, install_path, install_time, install_epoch,
+                 first_installed=False, first_installed_epoch=None, first_installed_time=None,
+                 type=None, status=None, repo_first_commit_date=None, host=None,
+                 host_first_installed=None):
+        self.formula = formula
+        self.version = version
+        self.install_path = install_path
+        self.install_time = install_time
+        self.install_epoch = install_epoch
+        self.first_installed = first_installed
+        self.first_installed_epoch = first_installed_epoch
+        self.first_installed_time = first_installed_time
+        self.type = type  # "cask" or None for formulae
+        self.status = status  # "available" or None for installed
+        self.repo_first_commit_date = repo_first_commit_date
+        self.host = host  # machine name in merged fleet indexes, else None
+        # Fleet indexes: first install of the (formula, version) on this host,
+        # where first_installed is across the whole fleet
+        self.host_first_installed = host_first_installed
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["formula"], d["version"], d.get("install_path"), d.get("install_time"),
+                   d.get("install_epoch"), d.get("first_installed", False),
+                   d.get("first_installed_epoch"), d.get("first_installed_time"),
+                   d.get("type"), d.get("status"), d.get("repo_first_commit_date"), d.get("host"),
+                   d.get("host_first_installed"))
+
+    @classmethod
+    def from_row(cls, row):
+        # SQLite installs row; status is stored as 'installed' rather than NULL
+        rec = cls(*row)
+        rec.first_installed = bool(rec.first_installed)
+        if rec.status == "installed":
+            rec.status = None
+        return rec
+
+    def as_row(self):
+        return (self.formula, self.version, self.install_path, self.install_time,
+                self.install_epoch, int(bool(self.first_installed)), self.first_installed_epoch,
+                self.first_installed_time, self.type, self.status or "installed",
+                self.repo_first_commit_date, self.host)
+
+    def to_dict(self):
+        # Keys in sorted order, matching json.dump(..., sort_keys=True)
+        d = {
+            "first_installed": self.first_installed,
+            "first_installed_epoch": self.first_installed_epoch,
+            "first_installed_time": self.first_installed_time,
+            "formula": self.formula,
+        }
+        if self.host is not None:
+            d["host"] = self.host
+        if self.host_first_installed is not None:
+            d["host_first_installed"] = self.host_first_installed
+        d["install_epoch"] = self.install_epoch
+        d["install_path"] = self.install_path
+        d["install_time"] = self.install_time
+        if self.repo_first_commit_date is not None:
+            d["repo_first_commit_date"] = self.repo_first_commit_date
+        if self.status is not None:
+            d["status"] = self.status
+        if self.type is not None:
+            d["type"] = self.type
+        d["version"] = self.version
+        return d
+
+    def is_host_first(self):
+        # Indexes merged before host_first_installed existed only have the fleet flag
+        return self.first_installed if self.host_first_installed is None else self.host_first_installed
+
+    def to_host_dict(self):
+        """to_dict() with first_installed* describing the first install on this record's host."""
+        d = self.to_dict()
+        d["first_installed"] = True
+        d["first_installed_epoch"] = self.install_epoch
+        d["first_installed_time"] = self.install_time
+        return d
+
+    def copy(self):
+        return InstallRecord(*(getattr(self, f) for f in self.__slots__))
+
+    @property
+    def group_key(self):
+        return (self.formula, self.version)
+
+    def sort_key(self):
+        # Order of installs_index.json
+        return (self.formula, self.version, self.install_epoch)
+
+    def __repr__(self):
+        return f"InstallRecord({self.formula!r}, {self.version!r}, {self.install_epoch!r})"
+
+def assign_first_installed(records, dirty_groups=None):
+    """Mark the earliest install of each (formula, version) group.
+
+    One pass finds each group's earliest (epoch, time) under a tuple key, a
+    second stamps it on the members; the group minimum reuses the member's
+    already formatted install_time. With dirty_groups set, only those groups
+    are recomputed and the rest keep their carried-over values.
+    """
+    earliest = {}
+    for r in records:
+        key = (r.formula, r.version)
+        if dirty_groups is not None and key not in dirty_groups:
+            continue
+        cur = earliest.get(key)
+        if cur is None or r.install_epoch < cur.install_epoch:
+            earliest[key] = r
+
+    for r in records:
+        first = earliest.get((r.formula, r.version))
+        if first is None:
+            continue
+        r.first_installed_epoch = first.install_epoch
+        r.first_installed_time = first.install_time
+        r.first_installed = (r.install_epoch == first.install_epoch)
+
+def _legacy_iso_time(epoch):
+    # The indexer's original per-record formatting, for the benchmark
+    if time.localtime(epoch).tm_isdst and time.daylight:
+        tz_offset = -time.altzone
+    else:
+        tz_offset = -time.timezone
+    tz_hours = tz_offset // 3600
+    tz_minutes = (tz_offset % 3600) // 60
+    tz_str = f"{tz_hours:+03d}{tz_minutes:02d}"
+    dt = datetime.fromtimestamp(epoch)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S") + tz_str
+
+def _legacy_build(raw):
+    records = []
+    for formula, version, path, epoch in raw:
+        records.append({
+            "formula": formula,
+            "version": version,
+            "install_path": path,
+            "install_time": _legacy_iso_time(epoch),
+            "install_epoch": epoch
+        })
+    groups = {}
+    for r in records:
+        key = f"{r['formula']}||{r['version']}"
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(r)
+    final_records = []
+    for key, group in groups.items():
+        min_epoch = min(item['install_epoch'] for item in group)
+        min_iso = _legacy_iso_time(min_epoch)
+        for item in group:
+            item['first_installed_epoch'] = min_epoch
+            item['first_installed_time'] = min_iso
+            item['first_installed'] = (item['install_epoch'] == min_epoch)
+            final_records.append(item)
+    return final_records
+
+def _record_build(raw):
+    records = [InstallRecord(formula, version, path, format_local_time(epoch), epoch)
+               for formula, version, path, epoch in raw]
+    assign_first_installed(records)
+    return records
+
+def benchmark(n=100000):
+    import random
+    import tracemalloc
+
+    rng = random.Random(42)
+    now = int(time.time())
+    raw = []
+    for i in range(n):
+        formula = f"formula{i // 3}"
+        version = f"1.{i % 2}"
+        raw.append((formula, version, f"/opt/homebrew/Cellar/{formula}/{version}/INSTALL_RECEIPT.json",
+                    now - rng.randrange(5 * 365 * 86400)))
+
+    legacy = _legacy_build(raw)
+    records = _record_build(raw)
+    key = lambda d: (d["formula"], d["version"], d["install_epoch"])
+    assert sorted(legacy, key=key) == sorted((r.to_dict() for r in records), key=key)
+    del legacy, records
+
+    print(f"{n} records")
+    for label, fn in (("dict records (original)", _legacy_build), ("InstallRecord", _record_build)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = fn(raw)
+        elapsed = time.perf_counter() - t0
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(f"  {label:<24} {elapsed:7.3f}s  retained {current / 2**20:7.1f} MiB  peak {peak / 2**20:7.1f} MiB")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
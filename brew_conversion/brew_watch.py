@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Pieces of `brew-index --watch`: directory watchers, the in-memory index and its socket.
+
+The daemon (watch_index in brew_index.py) keeps the index in a LiveIndex,
+waits on a watcher for changes under the Cellar, Caskroom and taps, and
+answers queries on a Unix socket next to installs_index.json. The protocol
+is one JSON object per line each way:
+
+    {"op": "query", "start": <epoch>, "end": <epoch>, "formula": null, "status": null, "host": null}
+        -> {"ok": true, "records": [...]}   same rows and order as query_range()
+    {"op": "ping"}
+        -> {"ok": true, "pid": ..., "records": <count>, "updated": <epoch>}
+
+Watchers use inotify on Linux and fall back to polling directory stats
+elsewhere. Both only look at directories, which is enough because brew adds,
+removes and rewrites receipts and kegs by creating and renaming entries.
+"""
+import bisect
+import errno
+import json
+import os
+import select
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+SOCKET_FILE = "installs_index.sock"
+
+# <linux/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+def _subdirs(path):
+    try:
+        with os.scandir(path) as it:
+            return [e.path for e in it if e.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+class InotifyWatcher:
+    """Watches directory trees with inotify (Linux).
+
+    sources is a list of (path, depth, kind): path and its subdirectories up to
+    `depth` levels down are watched, and changes are reported under `kind`.
+    Directories created later inside a watched tree are picked up as they appear.
+    """
+
+    def __init__(self, sources):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = self._get_errno()
+            raise OSError(err, os.strerror(err))
+        self.kinds = {kind for _, _, kind in sources}
+        self.watches = {}  # wd -> (path, depth, kind)
+        for path, depth, kind in sources:
+            self._watch_tree(path, depth, kind)
+
+    def _watch_tree(self, path, depth, kind):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = self._get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached; raise fs.inotify.max_user_watches")
+            return  # gone already, or not a directory
+        self.watches[wd] = (path, depth, kind)
+        if depth > 0:
+            for sub in _subdirs(path):
+                self._watch_tree(sub, depth - 1, kind)
+
+    def _read_events(self, changed):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.kinds)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                watch = self.watches.get(wd)
+                if watch is None:
+                    continue
+                path, depth, kind = watch
+                changed.add(kind)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and depth > 0:
+                    self._watch_tree(os.path.join(path, os.fsdecode(name)), depth - 1, kind)
+
+    def wait(self, timeout=None, settle=0.5):
+        """Block until something changes; returns the set of kinds that changed (empty on timeout).
+
+        Events are collected until none arrive for `settle` seconds, so one
+        `brew install` is reported once rather than per file.
+        """
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            self._read_events(changed)
+            ready, _, _ = select.select([self.fd], [], [], settle)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Same interface as InotifyWatcher, comparing directory stats every `interval` seconds."""
+
+    def __init__(self, sources, interval=2.0):
+        self.sources = sources
+        self.interval = interval
+        self._last = self._snapshot()
+
+    def _snapshot(self):
+        snap = {}
+
+        def walk(path, depth, kind):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            snap[path] = (kind, st.st_ino, st.st_mtime_ns)
+            if depth > 0:
+                for sub in _subdirs(path):
+                    walk(sub, depth - 1, kind)
+
+        for path, depth, kind in self.sources:
+            walk(path, depth, kind)
+        return snap
+
+    def wait(self, timeout=None, settle=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+            snap = self._snapshot()
+            if snap != self._last:
+                changed = {(snap.get(p) or self._last.get(p))[0]
+                           for p in snap.keys() | self._last.keys() if snap.get(p) != self._last.get(p)}
+                self._last = snap
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+    def close(self):
+        pass
+
+def make_watcher(sources, interval=2.0):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(sources)
+        except (OSError, AttributeError) as e:
+            print(f"Warning: inotify unavailable ({e}); polling every {interval}s", file=sys.stderr)
+    return PollingWatcher(sources, interval)
+
+class LiveIndex:
+    """The first-install rows of the current index, sorted for range queries."""
+
+    def __init__(self):
+        self.rows = []
+        self.epochs = []
+        # Fleet indexes: each host's own first installs, sorted by install_epoch
+        self.host_rows = []
+        self.host_epochs = []
+        self.total = 0
+        self.updated = None
+        self._lock = threading.Lock()
+
+    def replace(self, records):
+        # records in installs_index.json order; stable sort as in write_time_index
+        rows = sorted((r for r in records if r.first_installed), key=lambda r: r.first_installed_epoch)
+        epochs = [r.first_installed_epoch for r in rows]
+        host_rows = sorted((r for r in records if r.host is not None and r.is_host_first()),
+                           key=lambda r: r.install_epoch)
+        host_epochs = [r.install_epoch for r in host_rows]
+        with self._lock:
+            self.rows, self.epochs = rows, epochs
+            self.host_rows, self.host_epochs = host_rows, host_epochs
+            self.total = len(records)
+            self.updated = int(time.time())
+
+    def query(self, start_epoch, end_epoch, formula=None, status=None, host=None):
+        # With a host, the first installs on that host rather than across the fleet
+        with self._lock:
+            if host is None:
+                rows, epochs = self.rows, self.epochs
+            else:
+                rows, epochs = self.host_rows, self.host_epochs
+        lo = bisect.bisect_left(epochs, start_epoch)
+        hi = bisect.bisect_right(epochs, end_epoch)
+        return [
+            r.to_dict() if host is None else r.to_host_dict() for r in rows[lo:hi]
+            if (formula is None or r.formula == formula) and (status is None or (r.status or "installed") == status)
+            and (host is None or r.host == host)
+        ]
+
+    def answer(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "records": self.total, "updated": self.updated}
+        if op == "query":
+            records = self.query(int(request["start"]), int(request["end"]),
+                                 request.get("formula"), request.get("status"), request.get("host"))
+            return {"ok": True, "records": records}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.answer(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+
+class QueryServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, answer):
+        # answer(request dict) -> response dict
+        self.answer = answer
+        super().__init__(socket_path, _QueryHandler)
+
+def query_socket(socket_path, request, timeout=2.0):
+    """Send one request to a running daemon. Returns its response, or None if none answers."""
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    return response if response.get("ok") else None
+
+def claim_socket(socket_path):
+    # A socket file left by a daemon that died is removed; a live one is an error
+    if query_socket(socket_path, {"op": "ping"}) is not None:
+        raise RuntimeError(f"brew-index --watch is already running ({socket_path})")
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
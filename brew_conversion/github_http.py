@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Keep-alive GitHub API client used by brew_index.py enrichment.
+
+One persistent connection per worker thread, a token resolved once, and an
+adaptive concurrency limit driven by GitHub's rate-limit headers. REST calls go
+through get_json(), GraphQL queries through graphql(). Point GITHUB_API_URL at
+a local stub server (http://127.0.0.1:PORT) for testing.
+"""
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_API_URL = "https://api.github.com"
+_UNSET = object()  # GitHubClient(token=None) means "no token", not "look one up"
+
+def resolve_token(count_spawn=None):
+    # Environment first, then ask gh once; count_spawn is called with gh's argv
+    for var in ("GH_TOKEN", "GITHUB_TOKEN"):
+        token = os.environ.get(var)
+        if token:
+            return token
+    cmd = ["gh", "auth", "token"]
+    if count_spawn:
+        count_spawn(cmd)
+    try:
+        out = subprocess.check_output(cmd, text=True, stderr=subprocess.DEVNULL)
+        return out.strip() or None
+    except Exception:
+        return None
+
+def last_page_from_link(link_header):
+    # <url>; rel="next", <url>; rel="last"
+    if not link_header:
+        return 1
+    for url, rel in re.findall(r'<([^>]+)>;\s*rel="([^"]+)"', link_header):
+        if rel == "last":
+            m = re.search(r'[?&]page=(\d+)', url)
+            if m:
+                return int(m.group(1))
+    return 1
+
+class GraphQLError(RuntimeError):
+    """A GraphQL request that failed as a whole: an HTTP error, or errors and no data."""
+
+    def __init__(self, message, status=None, types=()):
+        super().__init__(message)
+        self.status = status
+        self.types = set(t for t in types if t)
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on rate-limit signals and creeps back up.
+
+    Also holds every caller while a Retry-After / X-RateLimit-Reset pause is
+    in effect, so workers don't keep hammering an exhausted quota.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.active = 0
+        self.pause_until = 0.0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while True:
+                wait = self.pause_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if self.active < self.limit:
+                    break
+                self._cond.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def backoff(self, delay):
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self._successes = 0
+            if delay > 0:
+                self.pause_until = max(self.pause_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def success(self, remaining=None):
+        with self._cond:
+            if remaining is not None and remaining < self.limit * 2:
+                # Running low: shrink before GitHub starts refusing us
+                self.limit = max(self.min_limit, self.limit - 1)
+                self._successes = 0
+                return
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+class GitHubClient:
+    def __init__(self, base_url=None, token=_UNSET, max_concurrency=8, max_retries=5, timeout=30):
+        self.base_url = (base_url or os.environ.get("GITHUB_API_URL") or DEFAULT_API_URL).rstrip("/")
+        parts = urlsplit(self.base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path
+        # GitHub Enterprise serves REST under /api/v3 but GraphQL at /api/graphql
+        self.graphql_path = (self.prefix[:-3] if self.prefix.endswith("/v3") else self.prefix) + "/graphql"
+        # Callers that already resolved the token pass it, even when it came back None
+        self.token = resolve_token() if token is _UNSET else token
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.requests = 0
+        self.retries = 0
+        self._local = threading.local()
+        self._conns = []
+        self._stats_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._stats_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _drop_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _headers(self):
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "User-Agent": "brew-index",
+            "X-GitHub-Api-Version": "2022-11-28",
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    @staticmethod
+    def _rate_limit_delay(status, headers):
+        # Returns seconds to wait if this response is a (secondary) rate limit, else None
+        if status not in (403, 429):
+            return None
+        retry_after = headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        if headers.get("x-ratelimit-remaining") == "0":
+            reset = headers.get("x-ratelimit-reset")
+            if reset and reset.isdigit():
+                return max(1, int(reset) - int(time.time()))
+            return 60
+        if status == 429:
+            return 60
+        return None
+
+    def request(self, method, path, body=None, max_retries=None, raw_path=False, retry_server_errors=True):
+        """Send a request, retrying on rate limits, 5xx and dropped connections.
+
+        path is relative to the API base URL unless raw_path is set. With
+        retry_server_errors=False a 5xx is returned at once (rate limits are
+        still waited out), for callers that react to it themselves. Returns
+        (status, headers, body_bytes); header names are lower-cased.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        url_path = path if raw_path else self.prefix + path
+        headers = self._headers()
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        attempt = 0
+        while True:
+            with self.limiter:
+                try:
+                    conn = self._conn()
+                    conn.request(method, url_path, body=body, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    status = resp.status
+                    resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+                    error = None
+                except (http.client.HTTPException, OSError) as e:
+                    self._drop_conn()
+                    status, resp_headers, data, error = None, {}, b"", e
+            with self._stats_lock:
+                self.requests += 1
+
+            if error is None:
+                delay = self._rate_limit_delay(status, resp_headers)
+                if delay is None and status < 500:
+                    remaining = resp_headers.get("x-ratelimit-remaining")
+                    self.limiter.success(int(remaining) if remaining and remaining.isdigit() else None)
+                    return status, resp_headers, data
+                if delay is None and not retry_server_errors:
+                    return status, resp_headers, data
+            else:
+                delay = None
+
+            attempt += 1
+            if attempt > max_retries:
+                if error is not None:
+                    raise error
+                return status, resp_headers, data
+            with self._stats_lock:
+                self.retries += 1
+            if error is not None:
+                # Idle keep-alive connections get dropped; reconnect at once the first time
+                if attempt > 1:
+                    time.sleep(min(30, 2 ** (attempt - 2)))
+                continue
+            if delay is None:
+                # 5xx: exponential backoff
+                delay = min(30, 2 ** (attempt - 1))
+            print(f"Debug: GitHub {status or error}, retrying {method} {path} in {delay}s", file=sys.stderr)
+            self.limiter.backoff(delay)
+
+    def get_json(self, path):
+        status, headers, data = self.request("GET", path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} returned HTTP {status}")
+        return json.loads(data or b"null"), headers
+
+    def graphql(self, query, variables=None, retry_server_errors=True):
+        """Run a GraphQL query. Returns (data, errors).
+
+        errors lists per-field errors alongside partial data; a response with no
+        data at all raises GraphQLError. Rate limits, as HTTP 403/429 or as a
+        RATE_LIMITED error, are waited out like REST ones. Pass
+        retry_server_errors=False for queries the caller would rather split
+        than retry (GitHub answers oversized ones with 502).
+        """
+        payload = {"query": query, "variables": variables or {}}
+        attempt = 0
+        while True:
+            status, headers, data = self.request("POST", self.graphql_path, payload, raw_path=True,
+                                                 retry_server_errors=retry_server_errors)
+            if status != 200:
+                raise GraphQLError(f"GraphQL returned HTTP {status}", status)
+            try:
+                result = json.loads(data or b"null") or {}
+            except ValueError as e:
+                raise GraphQLError(f"GraphQL returned invalid JSON: {e}", status)
+            errors = result.get("errors") or []
+            rate_limited = any(e.get("type") == "RATE_LIMITED" for e in errors)
+            if result.get("data") is not None or not rate_limited or attempt >= self.max_retries:
+                break
+            # GraphQL reports an exhausted quota with HTTP 200; pause everyone as for a 429
+            attempt += 1
+            with self._stats_lock:
+                self.retries += 1
+            delay = self._rate_limit_delay(429, headers)
+            print(f"Debug: GitHub GraphQL rate limited, retrying in {delay}s", file=sys.stderr)
+            self.limiter.backoff(delay)
+        if result.get("data") is None:
+            message = "; ".join(e.get("message", "") for e in errors) or "GraphQL returned no data"
+            raise GraphQLError(message, status, [e.get("type") for e in errors])
+        return result["data"], errors
+
+    def close(self):
+        with self._stats_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""`brew_index.py diff OLD NEW`: what changed between two index snapshots.
+
+    brew_index.py diff yesterday/installs_index.json.gz ~/.homebrew/installs_index.json [--json]
+
+Both indexes are sorted by (formula, version, install_epoch), so they are
+streamed side by side and compared one formula at a time (a merge join); only
+the current formula's records are in memory. Each change is one row:
+
+    added      installed in NEW, not in OLD at all
+    installed  installed in NEW, only listed as available in OLD
+    removed    installed in OLD, no longer installed in NEW
+    upgraded   installed in both, with different versions
+    available  newly listed as available in NEW
+
+Fleet indexes (`brew_index.py merge`) are compared per host. Output is TSV,
+or a JSON array with --json, written as the rows are found.
+"""
+import argparse
+import json
+import os
+import sys
+
+from index_io import find_index_file
+from index_merge import host_records
+
+CHANGE_KINDS = ("added", "installed", "removed", "upgraded", "available")
+TSV_COLUMNS = ("kind", "host", "formula", "type", "old_versions", "new_versions", "install_time")
+
+def _formula_groups(records):
+    # (formula, [records]) for consecutive runs of a sorted stream
+    group = []
+    for r in records:
+        if group and r.formula != group[0].formula:
+            yield group[0].formula, group
+            group = []
+        group.append(r)
+    if group:
+        yield group[0].formula, group
+
+def _versions(records):
+    return list(dict.fromkeys(r.version for r in records))
+
+def _changes(old, new):
+    # Rows for one formula, per host
+    hosts = {}
+    for side, records in ((0, old), (1, new)):
+        for r in records:
+            hosts.setdefault(r.host, ([], []))[side].append(r)
+
+    for host in sorted(hosts, key=lambda h: h or ""):
+        old_recs, new_recs = hosts[host]
+        old_inst = [r for r in old_recs if r.status != "available"]
+        new_inst = [r for r in new_recs if r.status != "available"]
+        old_avail = len(old_inst) < len(old_recs)
+        new_avail = [r for r in new_recs if r.status == "available"]
+        if new_inst and not old_inst:
+            kind = "installed" if old_avail else "added"
+        elif old_inst and not new_inst:
+            kind = "removed"
+        elif old_inst and _versions(old_inst) != _versions(new_inst):
+            kind = "upgraded"
+        elif new_avail and not old_recs:
+            kind = "available"
+        else:
+            continue
+
+        old_versions = _versions(old_inst)
+        latest = None
+        if kind == "available":
+            latest = new_avail[0]
+        elif new_inst:
+            # The newest install of a version OLD did not have
+            fresh = [r for r in new_inst if r.version not in old_versions] or new_inst
+            latest = max(fresh, key=lambda r: r.install_epoch)
+        sample = (new_recs or old_recs)[0]
+        row = {
+            "kind": kind,
+            "formula": sample.formula,
+            "old_versions": old_versions,
+            "new_versions": _versions(new_inst),
+            "install_time": latest.install_time if latest else None,
+        }
+        if host is not None:
+            row["host"] = host
+        if sample.type is not None:
+            row["type"] = sample.type
+        yield row
+
+def diff_indexes(old_path, new_path):
+    """Yield change rows (dicts) between two sorted index files, in formula order."""
+    old_groups = _formula_groups(host_records(old_path))
+    new_groups = _formula_groups(host_records(new_path))
+    o = next(old_groups, None)
+    n = next(new_groups, None)
+    while o is not None or n is not None:
+        if n is None or (o is not None and o[0] < n[0]):
+            yield from _changes(o[1], [])
+            o = next(old_groups, None)
+        elif o is None or n[0] < o[0]:
+            yield from _changes([], n[1])
+            n = next(new_groups, None)
+        else:
+            yield from _changes(o[1], n[1])
+            o, n = next(old_groups, None), next(new_groups, None)
+
+def _write_json(rows, out):
+    count = 0
+    for row in rows:
+        out.write(",\n  " if count else "[\n  ")
+        out.write(json.dumps(row, sort_keys=True))
+        count += 1
+    out.write("\n]\n" if count else "[]\n")
+
+def _write_tsv(rows, out):
+    out.write("\t".join(TSV_COLUMNS) + "\n")
+    for row in rows:
+        values = [row.get(c) or "" for c in TSV_COLUMNS]
+        out.write("\t".join(",".join(v) if isinstance(v, list) else v for v in values) + "\n")
+
+def _index_path(path):
+    if os.path.isdir(path):
+        found = find_index_file(path)
+        if found is None:
+            raise FileNotFoundError(f"no installs_index file in {path}")
+        return found
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"{path} does not exist")
+    return path
+
+def diff_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="brew_index.py diff",
+        description="Report installs added, removed, upgraded, installed from the available feed, "
+                    "or newly available between two index snapshots.")
+    parser.add_argument("old", help="Earlier index file (any format) or a directory containing one")
+    parser.add_argument("new", help="Later index file or directory")
+    parser.add_argument("--json", action="store_true", help="Output a JSON array instead of TSV")
+    parser.add_argument("--kind", action="append", choices=CHANGE_KINDS,
+                        help="Only report this kind of change (repeatable)")
+    args = parser.parse_args(argv)
+
+    try:
+        old_path, new_path = _index_path(args.old), _index_path(args.new)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    counts = dict.fromkeys(CHANGE_KINDS, 0)
+
+    def rows():
+        for row in diff_indexes(old_path, new_path):
+            if args.kind and row["kind"] not in args.kind:
+                continue
+            counts[row["kind"]] += 1
+            yield row
+
+    try:
+        (_write_json if args.json else _write_tsv)(rows(), sys.stdout)
+    except (OSError, ValueError) as e:
+        print(f"Error comparing {old_path} and {new_path}: {e}", file=sys.stderr)
+        return 1
+    print(", ".join(f"{n} {kind}" for kind, n in counts.items()), file=sys.stderr)
+    return 0
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Reading and writing installs_index in each of its formats.
+
+    json     installs_index.json     JSON array, indent=2 and sorted keys (the default)
+    compact  installs_index.json     JSON array, one record per line, no indentation
+    ndjson   installs_index.ndjson   one JSON record per line
+
+Any of them can be compressed, which appends .gz (gzip) or .zst (zstd; needs
+Python 3.14's compression.zstd or the zstandard package). Only one index file
+exists at a time: write_index_file() streams records into a temp file, renames
+it into place and removes the other variants (write_records_file() does the same
+for any other path, e.g. a merged fleet index). find_index_file() locates it and
+iter_index_file() streams its records back without loading the whole file.
+"""
+import gzip
+import io
+import json
+import os
+
+INDEX_BASENAME = "installs_index"
+FORMATS = ("json", "compact", "ndjson")
+COMPRESSIONS = ("none", "gzip", "zstd")
+_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+READ_CHUNK = 1 << 16
+
+def index_file_name(fmt="json", compress="none"):
+    return INDEX_BASENAME + (".ndjson" if fmt == "ndjson" else ".json") + _SUFFIXES[compress]
+
+# Sidecars brew_index.py writes next to the index for brew_first_installs.py range queries:
+#   installs_index.by_time.ndjson - first-install rows, one JSON object per line,
+#                                   sorted by first_installed_epoch
+#   installs_index.by_time.idx    - magic, (mtime_ns, size) of the index it was
+#                                   built from, then int64 epochs[n] and offsets[n+1]
+#   installs_index.sqlite         - the --sqlite copy of the index
+TIME_INDEX_MAGIC = b"BFI-TIX1"
+SQLITE_INDEX_FILE = INDEX_BASENAME + ".sqlite"
+
+def time_index_paths(directory):
+    """(data, idx) paths of the time index for the index in `directory`."""
+    base = os.path.join(directory, INDEX_BASENAME)
+    return base + ".by_time.ndjson", base + ".by_time.idx"
+
+def _all_names():
+    return list(dict.fromkeys(index_file_name(f, c) for f in FORMATS for c in COMPRESSIONS))
+
+def find_index_file(directory):
+    """Path of the index file in `directory`, or None. The newest wins if several exist."""
+    best, best_mtime = None, None
+    for name in _all_names():
+        path = os.path.join(directory, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        if best is None or mtime > best_mtime:
+            best, best_mtime = path, mtime
+    return best
+
+def _zstd():
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs Python 3.14+ or the zstandard package") from None
+
+def zstd_available():
+    try:
+        _zstd()
+    except RuntimeError:
+        return False
+    return True
+
+def _compressor(fileobj, compress):
+    if compress == "gzip":
+        # mtime=0 keeps identical indexes byte-identical
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6, mtime=0)
+    if compress == "zstd":
+        zstd = _zstd()
+        if hasattr(zstd, "ZstdFile"):
+            return zstd.ZstdFile(fileobj, "wb")
+        return zstd.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    return None
+
+def open_index_file(path):
+    """Open an index file for reading as binary, decompressing by suffix."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        return _zstd().open(path, "rb")
+    return open(path, "rb")
+
+def format_for_path(path):
+    """(fmt, compress) implied by a file name: .ndjson or JSON, then .gz / .zst."""
+    compress = "none"
+    for name, suffix in _SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            compress, path = name, path[:-len(suffix)]
+    return ("ndjson" if path.endswith(".ndjson") else "json"), compress
+
+def write_index_file(directory, records, fmt="json", compress="none"):
+    """Stream InstallRecords (already in index order) to the index file, atomically.
+
+    Returns the index path; the other index variants in `directory` are removed.
+    """
+    path = os.path.join(directory, index_file_name(fmt, compress))
+    write_records_file(path, records, fmt, compress)
+    for name in _all_names():
+        other = os.path.join(directory, name)
+        if other != path:
+            try:
+                os.unlink(other)
+            except FileNotFoundError:
+                pass
+    return path
+
+def load_json_sidecar(path, version):
+    """The JSON object in a versioned sidecar file, or None if it is missing or another version.
+
+    Raises OSError or ValueError if the file can't be read or parsed.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if isinstance(data, dict) and data.get("version") == version:
+        return data
+    return None
+
+def save_json_sidecar(path, data):
+    """Write a sidecar's JSON object to `path`, atomically (temp file, then os.replace)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def write_records_file(path, records, fmt="json", compress="none"):
+    """Stream InstallRecords to `path` in the given format, atomically. Returns the record count.
+
+    The temp file is fsynced before it is renamed over the old file, so
+    readers see either the old file or the new one, never a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as raw:
+            compressor = _compressor(raw, compress)
+            f = io.TextIOWrapper(compressor or raw, encoding="utf-8", newline="\n")
+            count = _write_records(f, records, fmt)
+            f.detach()  # flushes, leaves the streams open
+            if compressor:
+                compressor.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return count
+
+def _write_records(f, records, fmt):
+    count = 0
+    if fmt == "ndjson":
+        for r in records:
+            f.write(json.dumps(r.to_dict(), separators=(",", ":")))
+            f.write("\n")
+            count += 1
+        return count
+
+    if fmt == "compact":
+        f.write("[")
+        for r in records:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(r.to_dict(), separators=(",", ":")))
+            count += 1
+        f.write("]\n")
+        return count
+
+    # Byte-for-byte what json.dump(list, f, indent=2, sort_keys=True) produces
+    for r in records:
+        f.write(",\n  " if count else "[\n  ")
+        f.write(json.dumps(r.to_dict(), indent=2, sort_keys=True).replace("\n", "\n  "))
+        count += 1
+    f.write("\n]" if count else "[]")
+    return count
+
+def _decompress_errors(path):
+    # What a truncated or corrupt compressed file raises while it is read
+    if path.endswith(".gz"):
+        return (EOFError, gzip.BadGzipFile)
+    if path.endswith(".zst"):
+        return (EOFError, _zstd().ZstdError)
+    return ()
+
+def iter_index_file(path):
+    """Yield the records (dicts) of an index file of any format, one at a time.
+
+    A malformed, truncated or corrupt file raises ValueError.
+    """
+    errors = _decompress_errors(path)
+    with open_index_file(path) as raw:
+        try:
+            yield from iter_records(io.TextIOWrapper(raw, encoding="utf-8"))
+        except errors as e:
+            raise ValueError(f"{path} is truncated or corrupt: {e}") from e
+
+class _JSONChunks:
+    """A text stream read in chunks, with JSON values decoded off the front."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf, self.pos, self.eof = "", 0, False
+        self._decode = json.JSONDecoder().raw_decode
+
+    def _more(self):
+        more = self.f.read(READ_CHUNK)
+        self.eof = not more
+        self.buf, self.pos = self.buf[self.pos:] + more, 0
+
+    def peek(self, skip=" \t\r\n"):
+        """Skip characters in `skip`; return the next character, or "" at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._more()
+
+    def take(self):
+        self.pos += 1
+
+    def decode(self):
+        while True:
+            try:
+                obj, end = self._decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._more()  # the value spans the chunk boundary
+                continue
+            if end == len(self.buf) and not self.eof:
+                self._more()  # a number may continue in the next chunk
+                continue
+            self.pos = end
+            return obj
+
+def iter_records(f):
+    """Yield the JSON objects of a JSON array or NDJSON stream, reading it in chunks.
+
+    An array cut off before its closing ] raises ValueError, so a partial
+    file is never taken for a short one.
+    """
+    chunks = _JSONChunks(f)
+    in_array = chunks.peek() == "["
+    if in_array:
+        chunks.take()
+    while True:
+        # Skip whitespace and separators
+        c = chunks.peek(" \t\r\n,")
+        if c == "]" and in_array:
+            return
+        if c == "":
+            if in_array:
+                raise ValueError("unterminated JSON array")
+            return
+        yield chunks.decode()
+
+def iter_object_arrays(f):
+    """Yield (key, item) for the items of each array member of a top-level JSON object.
+
+    E.g. `brew info --json=v2` output, {"formulae": [...], "casks": [...]},
+    read from a pipe in chunks so only one item is decoded at a time.
+    Members that are not arrays are decoded and skipped.
+    """
+    stream = _JSONChunks(f)
+    if stream.peek() != "{":
+        raise ValueError("expected a JSON object")
+    stream.take()
+    while stream.peek(" \t\r\n,") not in ("}", ""):
+        key = stream.decode()
+        if stream.peek() != ":":
+            raise ValueError(f"expected ':' after {key!r}")
+        stream.take()
+        if stream.peek() != "[":
+            stream.decode()
+            continue
+        stream.take()
+        while stream.peek(" \t\r\n,") != "]":
+            if stream.eof and stream.pos >= len(stream.buf):
+                raise ValueError("unterminated JSON array")
+            yield key, stream.decode()
+        stream.take()
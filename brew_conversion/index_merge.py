@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""`brew_index.py merge`: combine installs indexes collected from many machines.
+
+    brew_index.py merge -o fleet.ndjson.gz mac-01=hosts/mac-01/installs_index.json hosts/mac-02 ...
+
+Each host's index is already sorted by (formula, version, install_epoch), so
+the fleet index is a streaming k-way merge (heapq.merge) of the inputs: every
+record is tagged with its host, and first_installed* is recomputed across the
+fleet, one (formula, version) group at a time, while host_first_installed keeps
+each host's own first install. Only the current group and one record per open
+input are held in memory.
+
+At most FAN_IN inputs are opened at once. With several inputs and --jobs > 1,
+groups of inputs are first merged into sorted NDJSON runs in worker processes
+(reading and decoding the inputs is most of the work), and the runs are then
+merged into the output.
+"""
+import argparse
+import heapq
+import math
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from brew_records import InstallRecord, assign_first_installed
+from index_io import FORMATS, find_index_file, format_for_path, iter_index_file, write_records_file, zstd_available
+
+FAN_IN = 64
+
+def merge_key(r):
+    return (r.formula, r.version, r.install_epoch, r.host or "")
+
+def parse_input(arg):
+    """(host, path) for a command-line input: HOST=PATH, a directory holding an index, or an index file.
+
+    Without HOST=, the host is the directory name for an installs_index.* file
+    or a directory, and the file name up to its first dot otherwise
+    (hosts/mac-01.json.gz -> mac-01).
+    """
+    host, sep, path = arg.partition("=")
+    if not sep or os.sep in host:
+        host, path = None, arg
+    if os.path.isdir(path):
+        index = find_index_file(path)
+        if index is None:
+            raise FileNotFoundError(f"no installs_index file in {path}")
+        return host or os.path.basename(os.path.abspath(path)), index
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"{path} does not exist")
+    if host is None:
+        name = os.path.basename(path)
+        if name.startswith("installs_index"):
+            host = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        else:
+            host = name.split(".", 1)[0]
+    return host, path
+
+def host_records(path, host=None):
+    """Stream an index as InstallRecords tagged with `host`, checking that it is sorted.
+
+    Records that already carry a host (an input that is itself a merged index)
+    keep it.
+    """
+    prev = None
+    for d in iter_index_file(path):
+        r = InstallRecord.from_dict(d)
+        if r.host is None:
+            r.host = host
+        key = merge_key(r)
+        if prev is not None and key < prev:
+            raise ValueError(f"{path} is not sorted by (formula, version, install_epoch)")
+        prev = key
+        yield r
+
+def _assign_fleet_group(group):
+    # group is in merge order, so the first record seen per host is its earliest
+    assign_first_installed(group)
+    host_first = {}
+    for r in group:
+        host_first.setdefault(r.host, r.install_epoch)
+        r.host_first_installed = (r.install_epoch == host_first[r.host])
+
+def fleet_first_installed(records):
+    """Recompute first_installed* per (formula, version) across hosts, for records in merge order.
+
+    host_first_installed marks the first install on each record's own host.
+    """
+    group = []
+    for r in records:
+        if group and (r.formula != group[0].formula or r.version != group[0].version):
+            _assign_fleet_group(group)
+            yield from group
+            group = []
+        group.append(r)
+    if group:
+        _assign_fleet_group(group)
+        yield from group
+
+def _merge_run(inputs, run_path):
+    # Worker: merge (host, path) inputs into one sorted NDJSON run
+    streams = [host_records(path, host) for host, path in inputs]
+    write_records_file(run_path, heapq.merge(*streams, key=merge_key), "ndjson")
+    return run_path
+
+def merge_indexes(inputs, output, fmt="json", compress="none", jobs=1, fan_in=FAN_IN):
+    """Merge (host, path) inputs into the fleet index at `output`. Returns the record count."""
+    runs = list(inputs)
+    tmp_parent = os.path.dirname(os.path.abspath(output))
+    with tempfile.TemporaryDirectory(prefix=".brew-merge-", dir=tmp_parent) as tmp:
+        level = 0
+        while True:
+            # Too many to open at once, or worth fanning out to the workers first
+            n_groups = math.ceil(len(runs) / fan_in)
+            if level == 0 and jobs > 1:
+                n_groups = max(n_groups, min(jobs, len(runs) // 2))
+            if n_groups < 2:
+                break
+            groups = [runs[i::n_groups] for i in range(n_groups)]
+            run_paths = [os.path.join(tmp, f"run-{level}-{i}.ndjson") for i in range(n_groups)]
+            if jobs > 1:
+                with ProcessPoolExecutor(max_workers=min(jobs, n_groups)) as pool:
+                    done = list(pool.map(_merge_run, groups, run_paths))
+            else:
+                done = list(map(_merge_run, groups, run_paths))
+            runs = [(None, path) for path in done]
+            level += 1
+
+        streams = [host_records(path, host) for host, path in runs]
+        merged = heapq.merge(*streams, key=merge_key)
+        return write_records_file(output, fleet_first_installed(merged), fmt, compress)
+
+def merge_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="brew_index.py merge",
+        description="Merge installs indexes from several machines into one fleet index, "
+                    "tagging each record with its host and computing first_installed across hosts.")
+    parser.add_argument("inputs", nargs="+", metavar="[HOST=]PATH",
+                        help="An index file (any format) or a directory containing one; "
+                             "the host defaults to the directory or file name")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Fleet index to write; .ndjson, .gz and .zst suffixes pick the format")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="Output format (default: from the --output name, else indented JSON)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes reading inputs in parallel (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    fmt, compress = format_for_path(args.output)
+    fmt = args.format or fmt
+    if compress == "zstd" and not zstd_available():
+        parser.error("zstd output needs Python 3.14+ or the zstandard package")
+
+    try:
+        inputs = [parse_input(arg) for arg in args.inputs]
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    hosts = {}
+    for host, path in inputs:
+        if host in hosts:
+            parser.error(f"host {host!r} given twice ({hosts[host]} and {path}); name them with HOST=PATH")
+        hosts[host] = path
+
+    try:
+        count = merge_indexes(inputs, args.output, fmt, compress, max(1, args.jobs))
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error merging into {args.output}: {e}", file=sys.stderr)
+        return 1
+    print(f"Merged {count} records from {len(inputs)} hosts into {args.output}")
+    return 0
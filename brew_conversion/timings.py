@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Per-phase timing and counters for brew-index --timings.
+
+    with TIMINGS.phase("scan"):
+        ...
+    TIMINGS.count("records.scanned", n)
+
+Phases record wall time (perf_counter) and process CPU time (all threads).
+Counters are thread-safe. TIMINGS.profile_phase names one phase to run under
+cProfile, including work it hands to thread pools; all of it lands in one
+stats file. From Python 3.12 one profiler sees every thread. Before that it
+only sees its own, so pool work submitted through TIMINGS.profiled(name, fn)
+gets a profiler per worker.
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 3.12 moved cProfile onto sys.monitoring: process-wide, and only one profiler at a time
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+class Timings:
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.profile_phase = None
+        self.profile_out = None
+        self._profiles = []  # finished profilers of the profiled phase, every thread
+        self._profiling = threading.local()  # per-thread profiler on, before 3.12
+        self._profile_active = False  # the process-wide profiler is on, 3.12+
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _set_profiling(self, on):
+        # Returns False if a profiler already covers this thread
+        with self._lock:
+            if PROFILER_SEES_ALL_THREADS:
+                if on and self._profile_active:
+                    return False
+                self._profile_active = on
+            else:
+                if on and getattr(self._profiling, "on", False):
+                    return False
+                self._profiling.on = on
+        return True
+
+    def _start_profile(self, name):
+        # A profiler, unless it is not the profiled phase or one is already on
+        if name != self.profile_phase or not self._set_profiling(True):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiling tool (a debugger, coverage) holds sys.monitoring
+            self._set_profiling(False)
+            print(f"Warning: Not profiling {name}: {e}", file=sys.stderr)
+            return None
+        return profiler
+
+    def _stop_profile(self, profiler):
+        profiler.disable()
+        self._set_profiling(False)
+        with self._lock:
+            self._profiles.append(profiler)
+            return list(self._profiles)
+
+    def profiled(self, name, fn):
+        """fn, profiled on whichever thread runs it when `name` is the profiled phase.
+
+        Wrap callables handed to a thread pool for a phase's work; before 3.12
+        cProfile only sees the thread it was enabled on. From 3.12 the phase's
+        profiler already covers them, and fn is returned as is.
+        """
+        if name != self.profile_phase or PROFILER_SEES_ALL_THREADS:
+            return fn
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            profiler = self._start_profile(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if profiler:
+                    self._stop_profile(profiler)
+        return run
+
+    @contextmanager
+    def phase(self, name):
+        profiler = self._start_profile(name)
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu = time.process_time() - cpu0
+            if profiler:
+                stats = pstats.Stats(*self._stop_profile(profiler))
+                stats.dump_stats(self.profile_out or f"brew_index.{name}.prof")
+            with self._lock:
+                p = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+                p["wall_s"] += wall
+                p["cpu_s"] += cpu
+                p["calls"] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def count_spawn(self, cmd):
+        # cmd is an argv list or a shell string; counted per executable
+        prog = cmd[0] if isinstance(cmd, (list, tuple)) else cmd.split(None, 1)[0]
+        self.count(f"subprocess.{os.path.basename(prog)}")
+
+    def report(self):
+        with self._lock:
+            return {
+                "total_wall_s": round(time.perf_counter() - self._start, 6),
+                "total_cpu_s": round(time.process_time(), 6),
+                "phases": {k: {"wall_s": round(v["wall_s"], 6), "cpu_s": round(v["cpu_s"], 6), "calls": v["calls"]}
+                           for k, v in self.phases.items()},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write(self, dest):
+        # dest is a file path, or "-" for stderr
+        report = json.dumps(self.report(), indent=2)
+        if dest == "-":
+            print(report, file=sys.stderr)
+            return
+        try:
+            with open(dest, "w") as f:
+                f.write(report + "\n")
+        except OSError as e:
+            print(f"Warning: Failed to write timings to {dest}: {e}", file=sys.stderr)
+
+TIMINGS = Timings()
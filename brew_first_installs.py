@@ -3,6 +3,9 @@
 Utility to find packages whose first-installed date falls between X and Y days ago.
 Usage:
     python3 brew_first_installs.py <X-days-ago> <Y-days-ago> [--json]
+    python3 brew_first_installs.py <X-days-ago> <Y-days-ago> --index fleet.ndjson.gz [--host HOST]
+    python3 brew_first_installs.py <X-days-ago> <Y-days-ago> --buckets week [--json]
+    python3 brew_first_installs.py --window 30:7 --window 7:0 [--json]
 
 Arguments:
     X   Older bound (days ago)
@@ -11,52 +14,529 @@ Arguments:
 """
 
 import argparse
+import bisect
 import json
 import os
+import re
+import sqlite3
+import struct
+import subprocess
 import sys
+import threading
 import time
+from array import array
 from pathlib import Path
 from datetime import datetime, timezone
 
+# Shared helpers live next to the indexer
+sys.path.insert(0, str(Path(__file__).resolve().parent / "brew_conversion"))
+from brew_env import resolve_brew_paths
+from brew_records import InstallRecord, format_local_time
+from brew_watch import SOCKET_FILE, LiveIndex, query_socket
+from index_io import (SQLITE_INDEX_FILE, TIME_INDEX_MAGIC, find_index_file, index_file_name, iter_index_file,
+                      save_json_sidecar, time_index_paths)
+
 # Helper to get ISO8601 string from epoch (used for display)
 def iso_from_epoch(epoch: int) -> str:
     dt = datetime.fromtimestamp(epoch, tz=timezone.utc)
     return dt.isoformat()
 
-def load_index(brew_repo: str) -> list:
-    index_path = Path(brew_repo) / "installs_index.json"
+def get_brew_repo() -> str:
+    # Same logic as brew_index.py; usually no brew process at all (see brew_env.py)
+    brew_repo = resolve_brew_paths()["repository"]
+    if not brew_repo:
+        brew_repo = os.path.expanduser("~/.homebrew")
+    return brew_repo
+
+def index_file(brew_repo: str) -> Path:
+    # installs_index.json unless brew-index wrote another --format/--compress
+    found = find_index_file(brew_repo)
+    return Path(found) if found else Path(brew_repo) / index_file_name()
+
+# Sidecar written by brew_index.py next to the index; see write_time_index there.
+def load_time_index(brew_repo: str):
+    """Return (epochs, offsets) from the sidecar, or None if missing or stale."""
+    index_path = index_file(brew_repo)
+    _, idx_path = time_index_paths(brew_repo)
+    try:
+        st = index_path.stat()
+        with open(idx_path, "rb") as f:
+            if f.read(len(TIME_INDEX_MAGIC)) != TIME_INDEX_MAGIC:
+                return None
+            mtime_ns, size = struct.unpack("<qq", f.read(16))
+            if (mtime_ns, size) != (st.st_mtime_ns, st.st_size):
+                return None
+            raw = array("q")
+            raw.frombytes(f.read())
+    except (OSError, struct.error, ValueError):
+        return None
+    n = (len(raw) - 1) // 2
+    return raw[:n], raw[n:]
+
+def open_sqlite_index(brew_repo: str):
+    """Open installs_index.sqlite read-only, or return None if missing or stale."""
+    index_path = index_file(brew_repo)
+    db_path = Path(brew_repo) / SQLITE_INDEX_FILE
+    if not db_path.is_file():
+        return None
+    try:
+        st = index_path.stat()
+        conn = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+    except (OSError, sqlite3.Error):
+        return None
+    if (meta.get("index_mtime_ns"), meta.get("index_size")) != (st.st_mtime_ns, st.st_size):
+        conn.close()
+        return None
+    return conn
+
+def query_sqlite(conn, start_epoch: int, end_epoch: int, formula: str = None, status: str = None,
+                 host: str = None) -> list:
+    sql = [
+        "SELECT formula, version, install_path, install_time, install_epoch, first_installed,",
+        "       first_installed_epoch, first_installed_time, type, status, repo_first_commit_date, host",
+        "FROM installs WHERE first_installed = 1 AND first_installed_epoch BETWEEN ? AND ?",
+    ]
+    params = [start_epoch, end_epoch]
+    if formula is not None:
+        sql.append("AND formula = ?")
+        params.append(formula)
+    if status is not None:
+        sql.append("AND status = ?")
+        params.append(status)
+    if host is not None:
+        sql.append("AND host = ?")
+        params.append(host)
+    sql.append("ORDER BY first_installed_epoch, formula, version, install_epoch")
+
+    return [InstallRecord.from_row(row).to_dict() for row in conn.execute("\n".join(sql), params)]
+
+def query_range(start_epoch: int, end_epoch: int, brew_repo: str = None,
+                formula: str = None, status: str = None, use_daemon: bool = True,
+                host: str = None, index_path: str = None) -> list:
+    """First-install records with start_epoch <= first_installed_epoch <= end_epoch.
+
+    Asks a running `brew-index --watch` over its socket first, unless
+    use_daemon is False. Next prefers installs_index.sqlite (brew-index
+    --sqlite), pushing all filters into SQL. Otherwise uses the sorted sidecar
+    index to binary-search the window and parse only the matching rows, and
+    finally falls back to streaming the index file itself (any --format or
+    --compress) when neither is present and current. formula, status
+    ("installed" or "available") and host (in a fleet index from `brew_index.py
+    merge`) narrow the result further; with a host, the records are that host's
+    own first installs, with first_installed* rewritten to describe them (see
+    InstallRecord.to_host_dict), rather than the fleet-wide ones. index_path
+    queries that file directly, e.g. a fleet index, by streaming it. Results
+    are ordered by first_installed_epoch. Raises FileNotFoundError if there is
+    no index at all.
+    """
+    def wanted(r):
+        return ((formula is None or r.get("formula") == formula)
+                and (status is None or r.get("status", "installed") == status)
+                and (host is None or r.get("host") == host))
+
+    if index_path is None:
+        if brew_repo is None:
+            brew_repo = get_brew_repo()
+
+        if use_daemon:
+            response = query_socket(str(Path(brew_repo) / SOCKET_FILE), {
+                "op": "query", "start": start_epoch, "end": end_epoch, "formula": formula, "status": status,
+                "host": host,
+            })
+            if response is not None:
+                return response["records"]
+
+        conn = open_sqlite_index(brew_repo)
+        if conn is not None:
+            try:
+                return query_sqlite(conn, start_epoch, end_epoch, formula, status, host)
+            except sqlite3.Error:
+                pass  # written by an older brew-index; use the other paths
+            finally:
+                conn.close()
+
+        time_index = load_time_index(brew_repo)
+        if time_index is not None:
+            epochs, offsets = time_index
+            lo = bisect.bisect_left(epochs, start_epoch)
+            hi = bisect.bisect_right(epochs, end_epoch)
+            if lo >= hi:
+                return []
+            with open(time_index_paths(brew_repo)[0], "rb") as f:
+                f.seek(offsets[lo])
+                chunk = f.read(offsets[hi] - offsets[lo])
+            return [r for r in map(json.loads, chunk.splitlines()) if wanted(r)]
+        index_path = index_file(brew_repo)
+
+    index_path = Path(index_path)
     if not index_path.is_file():
-        print(f"Index file not found at {index_path}", file=sys.stderr)
-        sys.exit(2)
-    with open(index_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        raise FileNotFoundError(str(index_path))
+    if host is not None:
+        matches = []
+        for d in iter_index_file(str(index_path)):
+            if d.get("host") == host and start_epoch <= d.get("install_epoch", 0) <= end_epoch and wanted(d):
+                r = InstallRecord.from_dict(d)
+                if r.is_host_first():
+                    matches.append(r.to_host_dict())
+    else:
+        matches = [
+            r for r in iter_index_file(str(index_path))
+            if r.get("first_installed")
+            and start_epoch <= r.get("first_installed_epoch", 0) <= end_epoch
+            and wanted(r)
+        ]
+    matches.sort(key=lambda r: r.get("first_installed_epoch", 0))
+    return matches
+
+class Query:
+    """query_range() for long-running callers: the index is parsed once and kept in memory.
+
+        q = Query()
+        rows = q.range(start_epoch, end_epoch, formula="wget")
+
+    Each call stats the index file (`index_path`, or whichever installs_index.*
+    is in brew_repo) and reloads it only when its mtime or size changed, so
+    thousands of queries cost one parse. Results match query_range(). Safe to
+    share between threads.
+    """
+
+    def __init__(self, brew_repo: str = None, index_path: str = None):
+        if index_path is None and brew_repo is None:
+            brew_repo = get_brew_repo()
+        self.brew_repo = brew_repo
+        self.index_path = index_path
+        self._live = LiveIndex()
+        self._loaded = None  # (path, mtime_ns, size) of the loaded file
+        self._lock = threading.Lock()
+
+    def _path(self) -> Path:
+        return Path(self.index_path) if self.index_path else index_file(self.brew_repo)
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index if the file changed since the last load. Returns True if it did.
+
+        Raises FileNotFoundError if there is no index.
+        """
+        path = self._path()
+        st = path.stat()
+        stamp = (str(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp == self._loaded:
+                return False
+            self._live.replace([InstallRecord.from_dict(d) for d in iter_index_file(str(path))])
+            self._loaded = stamp
+        return True
+
+    def range(self, start_epoch: int, end_epoch: int, formula: str = None, status: str = None,
+              host: str = None) -> list:
+        self.reload_if_changed()
+        return self._live.query(start_epoch, end_epoch, formula, status, host)
+
+    def __len__(self):
+        self.reload_if_changed()
+        return self._live.total
+
+# Aggregation mode (--buckets / --window): one query_range() over the union of
+# all windows, then each window is a bisect over the sorted first-install epochs.
+BUCKET_SIZES = ("day", "week", "month")
+
+def _bucket_floor(epoch: int, size: str) -> datetime:
+    # Start of the local calendar day, week (Monday) or month containing epoch
+    dt = datetime.fromtimestamp(epoch).replace(hour=0, minute=0, second=0, microsecond=0)
+    if size == "week":
+        dt = datetime.fromordinal(dt.toordinal() - dt.weekday())
+    elif size == "month":
+        dt = dt.replace(day=1)
+    return dt
+
+def _bucket_next(dt: datetime, size: str) -> datetime:
+    if size == "month":
+        return dt.replace(year=dt.year + dt.month // 12, month=dt.month % 12 + 1)
+    return datetime.fromordinal(dt.toordinal() + (7 if size == "week" else 1))
+
+def calendar_windows(start_epoch: int, end_epoch: int, size: str) -> list:
+    """(label, start, end) per local calendar day/week/month, clipped to [start_epoch, end_epoch].
+
+    Boundaries go through mktime, so days that a DST change makes 23 or 25
+    hours long are still one bucket each.
+    """
+    windows = []
+    dt = _bucket_floor(start_epoch, size)
+    while True:
+        nxt = _bucket_next(dt, size)
+        lo = int(time.mktime(dt.timetuple()))
+        hi = int(time.mktime(nxt.timetuple())) - 1
+        if lo > end_epoch:
+            break
+        windows.append((dt.strftime("%Y-%m" if size == "month" else "%Y-%m-%d"),
+                        max(lo, start_epoch), min(hi, end_epoch)))
+        dt = nxt
+    return windows
+
+def aggregate(rows: list, windows: list) -> list:
+    """Count and list the rows in each (label, start, end) window, split by status.
+
+    rows must be sorted by first_installed_epoch, as query_range() returns
+    them; windows may overlap. Members are formula/cask names, one per row.
+    """
+    epochs = [r.get("first_installed_epoch", 0) for r in rows]
+    buckets = []
+    for label, start, end in windows:
+        members = {"installed": [], "available": []}
+        for r in rows[bisect.bisect_left(epochs, start):bisect.bisect_right(epochs, end)]:
+            members["available" if r.get("status") == "available" else "installed"].append(r.get("formula", ""))
+        buckets.append({
+            "window": label,
+            "start": start,
+            "end": end,
+            "start_time": format_local_time(start),
+            "end_time": format_local_time(end),
+            "installed": len(members["installed"]),
+            "available": len(members["available"]),
+            "installed_members": members["installed"],
+            "available_members": members["available"],
+        })
+    return buckets
+
+def write_aggregate_tsv(buckets: list, out=sys.stdout):
+    columns = ("window", "start_time", "end_time", "installed", "available", "installed_members", "available_members")
+    out.write("\t".join(columns) + "\n")
+    for b in buckets:
+        row = [b[c] for c in columns[:5]] + [",".join(b["installed_members"]), ",".join(b["available_members"])]
+        out.write("\t".join(map(str, row)) + "\n")
+
+# --info resolves every match with `brew info --json=v2`, INFO_CHUNK_SIZE names per
+# call, instead of one Ruby startup per formula. With --info-cache the results are
+# kept next to the index and thrown away whenever installs_index.json changes.
+INFO_CHUNK_SIZE = 50
+INFO_CACHE_FILE = "installs_index.info_cache.json"
+
+# brew's error for a name it doesn't know, e.g. `Error: No available formula with
+# the name "foo".` It stops at the first one, so a call may report just one.
+UNKNOWN_NAME_RE = re.compile(r'(?:with the name|found for) "([^"]+)"')
+
+def _run_brew_info(names: list):
+    """(data, unknown) for one `brew info --json=v2` call.
+
+    data is the parsed output, or None if the call failed; unknown holds the
+    requested names its error output reports as unknown. Raises OSError if brew
+    cannot be run.
+    """
+    proc = subprocess.run(["brew", "info", "--json=v2", *names],
+                          capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        return None, set(UNKNOWN_NAME_RE.findall(proc.stderr)) & set(names)
+    try:
+        return json.loads(proc.stdout), set()
+    except ValueError:
+        return None, set()
+
+def _collect_brew_info(data: dict, found: dict):
+    # Register each item under every name a record might use for it
+    for kind, items in (("formula", data.get("formulae", [])), ("cask", data.get("casks", []))):
+        for item in items:
+            keys = [item.get("name"), item.get("full_name"), item.get("token"), item.get("full_token")]
+            keys += item.get("aliases", []) + item.get("oldnames", [])
+            for k in keys:
+                if k and isinstance(k, str):
+                    found.setdefault(k, (kind, item))
+
+def brew_info_json(names: list) -> dict:
+    """Return {name: (kind, item)} from chunked `brew info --json=v2` calls."""
+    found = {}
+
+    def fetch(chunk):
+        while chunk:
+            data, unknown = _run_brew_info(chunk)
+            if data is not None:
+                _collect_brew_info(data, found)
+                return
+            if not unknown:
+                break
+            # One unknown name fails the whole call; drop the ones brew named and retry
+            chunk = [n for n in chunk if n not in unknown]
+        if len(chunk) > 1:
+            # A failure that names nothing we asked for; bisect to isolate it
+            mid = len(chunk) // 2
+            fetch(chunk[:mid])
+            fetch(chunk[mid:])
+
+    try:
+        for i in range(0, len(names), INFO_CHUNK_SIZE):
+            fetch(names[i:i + INFO_CHUNK_SIZE])
+    except OSError as e:
+        print(f"Error running brew info: {e}", file=sys.stderr)
+    return found
+
+def load_brew_info(brew_repo: str, names: list, use_cache: bool = False) -> dict:
+    cache_path = Path(brew_repo) / INFO_CACHE_FILE
+    index_path = index_file(brew_repo)
+    try:
+        index_mtime = index_path.stat().st_mtime_ns
+    except OSError:
+        index_mtime = None
+
+    cached = {}
+    if use_cache:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("index_mtime_ns") == index_mtime:
+                cached = {k: tuple(v) if v else None for k, v in data.get("entries", {}).items()}
+        except (OSError, ValueError):
+            pass
+
+    missing = [n for n in names if n not in cached]
+    if missing:
+        fetched = brew_info_json(missing)
+        # Unknown names are cached as None so they aren't looked up again
+        cached.update({n: fetched.get(n) for n in missing})
+        if use_cache:
+            try:
+                save_json_sidecar(str(cache_path), {"index_mtime_ns": index_mtime, "entries": cached})
+            except OSError as e:
+                print(f"Warning: Failed to write info cache {cache_path}: {e}", file=sys.stderr)
+    return {n: cached[n] for n in names if cached.get(n)}
+
+def _tap_blob_url(item: dict):
+    tap, path = item.get("tap"), item.get("ruby_source_path")
+    if not tap or not path or "/" not in tap:
+        return None
+    user, repo = tap.split("/", 1)
+    return f"https://github.com/{user}/homebrew-{repo}/blob/HEAD/{path}"
+
+def format_brew_info(kind: str, item: dict) -> str:
+    """Render a `brew info --json=v2` formula or cask roughly like `brew info` does."""
+    lines = []
+    if kind == "cask":
+        version = item.get("version") or ""
+        extra = " (auto_updates)" if item.get("auto_updates") else ""
+        lines.append(f"==> {item.get('full_token') or item.get('token')}: {version}{extra}")
+        names = item.get("name") or []
+        if names:
+            lines.append(", ".join(names))
+        if item.get("homepage"):
+            lines.append(item["homepage"])
+        installed = item.get("installed")
+        lines.append(f"Installed: {installed}" if installed else "Not installed")
+        url = _tap_blob_url(item)
+        if url:
+            lines.append(f"From: {url}")
+        if item.get("desc"):
+            lines.append("==> Description")
+            lines.append(item["desc"])
+    else:
+        versions = item.get("versions") or {}
+        head = ", HEAD" if versions.get("head") else ""
+        bottled = " (bottled)" if versions.get("bottle") else ""
+        lines.append(f"==> {item.get('full_name') or item.get('name')}: stable {versions.get('stable')}{bottled}{head}")
+        if item.get("desc"):
+            lines.append(item["desc"])
+        if item.get("homepage"):
+            lines.append(item["homepage"])
+        installed = [i.get("version") for i in item.get("installed") or [] if i.get("version")]
+        lines.append(f"Installed: {', '.join(installed)}" if installed else "Not installed")
+        url = _tap_blob_url(item)
+        if url:
+            lines.append(f"From: {url}")
+        if item.get("license"):
+            lines.append(f"License: {item['license']}")
+        build = item.get("build_dependencies") or []
+        required = item.get("dependencies") or []
+        if build or required:
+            lines.append("==> Dependencies")
+            if build:
+                lines.append(f"Build: {', '.join(build)}")
+            if required:
+                lines.append(f"Required: {', '.join(required)}")
+    if item.get("caveats"):
+        lines.append("==> Caveats")
+        lines.append(item["caveats"].rstrip())
+    return "\n".join(lines)
 
 def main():
     parser = argparse.ArgumentParser(description="Find packages installed for the first time between X and Y days ago.")
-    parser.add_argument("X", type=int, help="Older bound (days ago)")
-    parser.add_argument("Y", type=int, help="Newer bound (days ago)")
+    parser.add_argument("X", type=int, nargs="?", help="Older bound (days ago)")
+    parser.add_argument("Y", type=int, nargs="?", help="Newer bound (days ago)")
     parser.add_argument("--json", action="store_true", help="Output raw JSON array")
     parser.add_argument("--info", action="store_true", help="Show brew info for each match")
+    parser.add_argument("--info-cache", action="store_true", help="Cache --info results next to the index until it is rebuilt")
+    parser.add_argument("--formula", help="Only show this formula or cask")
+    parser.add_argument("--status", choices=["installed", "available"], help="Only show installed or available packages")
+    parser.add_argument("--no-daemon", action="store_true", help="Read the index files even if brew-index --watch is running")
+    parser.add_argument("--index", metavar="FILE", help="Query this index file instead, e.g. a fleet index from `brew_index.py merge`")
+    parser.add_argument("--host", help="Only show first installs on this host (fleet indexes); first_installed* "
+                             "then describe the host's own first install, not the fleet's")
+    parser.add_argument("--buckets", choices=BUCKET_SIZES,
+                        help="Aggregate: count first installs per local calendar day, week or month between X and Y")
+    parser.add_argument("--window", action="append", default=[], metavar="X:Y",
+                        help="Aggregate: count first installs between X and Y days ago (repeatable). "
+                             "30: runs up to now, :7 from the first install on; "
+                             "the positional X and Y may then be omitted")
     args = parser.parse_args()
 
-    # Determine brew repository location (same logic as brew_index.py)
-    brew_repo = os.popen("brew --repository 2>/dev/null").read().strip()
-    if not brew_repo:
-        brew_repo = os.path.expanduser("~/.homebrew")
+    windows = []
+    for spec in args.window:
+        # An open X reaches back to the first install (older is None), an open Y is now
+        older, sep, newer = spec.partition(":")
+        try:
+            if not sep:
+                raise ValueError
+            older = int(older) if older.strip() else None
+            newer = int(newer) if newer.strip() else 0
+        except ValueError:
+            parser.error(f"--window expects X:Y in days (either may be left out), got {spec!r}")
+        windows.append((spec, older, newer))
+    if args.X is None or args.Y is None:
+        if not windows or args.buckets:
+            parser.error("the following arguments are required: X, Y")
+        # Open windows widen the query below
+        args.X = max((w[1] for w in windows if w[1] is not None), default=0)
+        args.Y = min(w[2] for w in windows)
+    aggregating = bool(windows or args.buckets)
+    if aggregating and args.info:
+        parser.error("--info cannot be combined with --buckets or --window")
+
+    # Determine brew repository location (still needed by --info with --index)
+    brew_repo = get_brew_repo()
 
     # Compute epoch boundaries based on current time
     now = int(time.time())
     start_epoch = now - args.X * 86400  # older bound
     end_epoch = now - args.Y * 86400    # newer bound
+    windows = [(label, 0 if older is None else now - older * 86400, now - newer * 86400)
+               for label, older, newer in windows]
+    if args.buckets:
+        windows += calendar_windows(start_epoch, end_epoch, args.buckets)
+    if windows:
+        start_epoch = min(start_epoch, min(w[1] for w in windows))
+        end_epoch = max(end_epoch, max(w[2] for w in windows))
 
-    records = load_index(brew_repo)
+    # Records with first_installed == true and epoch within range (inclusive)
+    try:
+        matches = query_range(start_epoch, end_epoch, brew_repo, formula=args.formula, status=args.status,
+                              use_daemon=not args.no_daemon, host=args.host, index_path=args.index)
+    except FileNotFoundError:
+        print(f"Index file not found at {args.index or index_file(brew_repo)}", file=sys.stderr)
+        sys.exit(2)
+    except (OSError, ValueError) as e:
+        print(f"Error reading index {args.index or index_file(brew_repo)}: {e}", file=sys.stderr)
+        sys.exit(2)
 
-    # Filter records: first_installed == true and epoch within range (inclusive)
-    matches = [
-        r for r in records
-        if r.get("first_installed")
-        and start_epoch <= r.get("first_installed_epoch", 0) <= end_epoch
-    ]
+    if aggregating:
+        buckets = aggregate(matches, windows)
+        if args.json:
+            json.dump(buckets, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            write_aggregate_tsv(buckets)
+        return
+
+    # Keep the index's (formula, version) ordering for output
+    matches.sort(key=lambda r: (r.get("formula", ""), r.get("version", ""), r.get("install_epoch", 0),
+                                r.get("host", "")))
+    show_host = any(r.get("host") for r in matches)
 
     if args.json:
         # Output raw JSON array
@@ -77,22 +557,23 @@ def main():
             if status == "available":
                 status_str = "(Available)"
 
-            # Align columns: Time, Formula, Version, Status, Path
-            print(f"{first_time:<25}  {formula:<30}  {version:<15}  {status_str:<12} {install_path}")
+            # Align columns: Time, Formula, Version, Status, [Host,] Path
+            host = f"{r.get('host', ''):<20} " if show_host else ""
+            print(f"{first_time:<25}  {formula:<30}  {version:<15}  {status_str:<12} {host}{install_path}")
 
         if args.info:
             print("\n" + "="*80 + "\n")
-            import subprocess
+            names = list(dict.fromkeys(r["formula"] for r in matches if r.get("formula")))
+            info = load_brew_info(brew_repo, names, use_cache=args.info_cache)
             for r in matches:
                 formula = r.get("formula")
                 if formula:
                     print(f"--- Info for {formula} ---")
-                    # Run brew info, let it stream to stdout/stderr
-                    # Use 'brew info <formula>'
-                    try:
-                        subprocess.run(["brew", "info", formula], check=False)
-                    except Exception as e:
-                       print(f"Error running info for {formula}: {e}", file=sys.stderr)
+                    if formula in info:
+                        kind, item = info[formula]
+                        print(format_brew_info(kind, item))
+                    else:
+                        print(f"No brew info available for {formula}")
                     print("\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+"""brew_first_installs.py --info lookups against the fake brew of bench/synth_env.py.
+
+Runs under pytest, or directly: python3 test_brew_first_installs.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+import brew_first_installs
+from synth_env import create_env
+
+def test_brew_info_unknown_names():
+    with tempfile.TemporaryDirectory() as tmp:
+        env_root = Path(tmp) / "env"
+        create_env(env_root, kegs=120, casks=5)
+        known = sorted(p.name for p in (env_root / "Cellar").iterdir())[:100]
+        names = known[:3] + ["nope-a"] + known[3:60] + ["nope-b", "nope-c"] + known[60:]
+
+        runs = []
+        real_run = brew_first_installs.subprocess.run
+        def counting_run(cmd, **kwargs):
+            runs.append(cmd)
+            return real_run(cmd, **kwargs)
+
+        saved_env = dict(os.environ)
+        os.environ["PATH"] = f"{env_root / 'bin'}{os.pathsep}{os.environ['PATH']}"
+        os.environ["BENCH_BREW_DELAY"] = "0"
+        brew_first_installs.subprocess.run = counting_run
+        try:
+            found = brew_first_installs.brew_info_json(names)
+        finally:
+            brew_first_installs.subprocess.run = real_run
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+        assert set(known) <= set(found)
+        assert not {"nope-a", "nope-b", "nope-c"} & set(found)
+        # Three chunks, plus one retry per unknown name brew reports (it names one per run)
+        assert len(runs) == 3 + 3, runs
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,124 @@
+"""End-to-end checks for brew_index.py on a small synthetic environment (bench/synth_env.py).
+
+Runs under pytest, or directly: python3 test_brew_index.py
+"""
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+BREW_INDEX = ROOT / "brew_conversion" / "brew_index.py"
+sys.path.insert(0, str(ROOT / "bench"))
+from synth_env import create_env
+
+def make_env(directory, kegs=40, casks=5):
+    env_root = Path(directory) / "env"
+    create_env(env_root, kegs=kegs, casks=casks)
+    return env_root
+
+def run_brew_index(env_root, *args, python=sys.executable):
+    env = dict(os.environ,
+               PATH=f"{env_root / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+               XDG_CACHE_HOME=str(env_root / "cache"),
+               HOMEBREW_PREFIX=str(env_root),
+               HOMEBREW_REPOSITORY=str(env_root / "repo"),
+               HOMEBREW_CELLAR=str(env_root / "Cellar"),
+               BENCH_BREW_DELAY="0")
+    for var in ("GH_TOKEN", "GITHUB_TOKEN", "BENCH_LOG"):
+        env.pop(var, None)
+    return subprocess.run([python, str(BREW_INDEX), *args], env=env, capture_output=True, text=True)
+
+def _pythons():
+    # The running interpreter, plus 3.12+ if installed: cProfile works differently there
+    found = {sys.executable}
+    for name in ("python3.12", "python3.13"):
+        path = shutil.which(name)
+        # Version-manager shims may exist without the version being usable
+        if path and subprocess.run([path, "-c", ""], capture_output=True).returncode == 0:
+            found.add(path)
+    return sorted(found)
+
+def test_profile_scan():
+    with tempfile.TemporaryDirectory() as tmp:
+        env_root = make_env(tmp)
+        for python in _pythons():
+            for jobs in ("1", "4"):
+                prof = Path(tmp) / "scan.prof"
+                result = run_brew_index(env_root, "--jobs", jobs, "--profile", "scan", "--profile-out", str(prof),
+                                        python=python)
+                assert result.returncode == 0, f"{python}: {result.stderr}"
+                assert (env_root / "repo" / "installs_index.json").is_file()
+                # The receipts are read on the pool's threads
+                functions = {func for _, _, func in pstats.Stats(str(prof)).stats}
+                assert "receipt_record" in functions, python
+                prof.unlink()
+
+def _full_and_incremental(env_root):
+    # installs_index.json from an incremental run on the saved state, then from scratch
+    repo = env_root / "repo"
+    result = run_brew_index(env_root, "--incremental")
+    assert result.returncode == 0, result.stderr
+    assert "Incremental scan:" in result.stderr
+    incremental = (repo / "installs_index.json").read_bytes()
+    state = repo / "installs_index.state.json"
+    saved = state.read_bytes()
+    state.unlink()
+    result = run_brew_index(env_root)
+    assert result.returncode == 0, result.stderr
+    full = (repo / "installs_index.json").read_bytes()
+    state.write_bytes(saved)
+    return incremental, full
+
+def _add_version(keg_dir, version, receipt_from, mtime):
+    d = keg_dir / version
+    (d / "bin").mkdir(parents=True)
+    receipt = d / "INSTALL_RECEIPT.json"
+    receipt.write_bytes((receipt_from / "INSTALL_RECEIPT.json").read_bytes())
+    os.utime(receipt, (mtime, mtime))
+
+def _rewrite_receipt(version_dir, formula):
+    receipt = version_dir / "INSTALL_RECEIPT.json"
+    mtime = receipt.stat().st_mtime + 60
+    receipt.write_text(json.dumps({"formula": {"name": formula}, "installed_on_request": True}))
+    os.utime(receipt, (mtime, mtime))
+
+def test_incremental_matches_full_rebuild():
+    with tempfile.TemporaryDirectory() as tmp:
+        env_root = make_env(tmp)
+        cellar = env_root / "Cellar"
+        result = run_brew_index(env_root, "--incremental")
+        assert result.returncode == 0, result.stderr
+
+        kegs = sorted(p for p in cellar.iterdir() if p.is_dir())
+        multi = [k for k in kegs if len(list(k.iterdir())) > 1]
+        single = [k for k in kegs if len(list(k.iterdir())) == 1]
+        assert multi and len(single) >= 3
+        first = single[0] / "1.0"
+        # A keg dir whose receipt names another formula joins that (formula, version) group
+        renamed = cellar / "zz-renamed"
+        steps = [
+            ("add version", lambda: _add_version(single[0], "9.0", first, first.stat().st_mtime + 86400)),
+            ("add older keg to a group", lambda: _add_version(renamed, "1.0", first, 1_000_000_000)),
+            # Dropping the group's first install makes the remaining one first again
+            ("remove keg from a group", lambda: shutil.rmtree(renamed)),
+            ("add it back", lambda: _add_version(renamed, "1.0", first, 1_000_000_000)),
+            # A rewritten receipt moves the keg from one group to another
+            ("receipt names another formula", lambda: _rewrite_receipt(renamed / "1.0", single[1].name)),
+            ("remove version", lambda: shutil.rmtree(multi[0] / "1.0")),
+            ("remove keg entirely", lambda: shutil.rmtree(single[2])),
+        ]
+        for name, change in steps:
+            change()
+            incremental, full = _full_and_incremental(env_root)
+            assert incremental == full, name
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
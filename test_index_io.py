@@ -0,0 +1,115 @@
+"""Chunked readers in brew_conversion/index_io.py, at chunk sizes that split every token.
+
+Runs under pytest, or directly: python3 test_index_io.py
+"""
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "brew_conversion"))
+import index_io
+
+CHUNK_SIZES = (1, 2, 3, 7)
+
+RECORDS = [
+    {"formula": "a", "version": "1.0", "install_epoch": 1700000000, "first_installed": True},
+    {"formula": "b é", "version": "12345", "install_epoch": 678, "first_installed": False},
+    {"formula": "c", "version": "2", "install_epoch": -1, "nested": {"x": [1, 2.5, None, "]"]}},
+]
+
+def _chunked(test):
+    # Run test(chunk_size) with index_io reading that many characters at a time
+    saved = index_io.READ_CHUNK
+    try:
+        for size in CHUNK_SIZES:
+            index_io.READ_CHUNK = size
+            test(size)
+    finally:
+        index_io.READ_CHUNK = saved
+
+def _raises_value_error(fn):
+    try:
+        fn()
+    except ValueError:
+        return True
+    return False
+
+def test_iter_records_json_and_ndjson():
+    texts = {
+        "json": json.dumps(RECORDS, indent=2, sort_keys=True),
+        "compact": "[\n" + ",\n".join(json.dumps(r) for r in RECORDS) + "\n]\n",
+        "ndjson": "".join(json.dumps(r) + "\n" for r in RECORDS),
+    }
+
+    def check(size):
+        for name, text in texts.items():
+            assert list(index_io.iter_records(io.StringIO(text))) == RECORDS, (name, size)
+        # Numbers must not be split at chunk boundaries
+        assert list(index_io.iter_records(io.StringIO("[12345, 678]"))) == [12345, 678], size
+        assert list(index_io.iter_records(io.StringIO("12345\n678\n"))) == [12345, 678], size
+        assert list(index_io.iter_records(io.StringIO("[ ]"))) == [], size
+        assert list(index_io.iter_records(io.StringIO(""))) == [], size
+    _chunked(check)
+
+def test_iter_records_truncated():
+    text = json.dumps(RECORDS)
+    cut_after_record = text[:text.index("}, {") + 1]
+
+    def check(size):
+        for bad in (cut_after_record, cut_after_record + ",", text[:-5], "[", '[{"a": 1'):
+            assert _raises_value_error(lambda: list(index_io.iter_records(io.StringIO(bad)))), (bad, size)
+    _chunked(check)
+
+def test_iter_object_arrays():
+    doc = {"formulae": RECORDS[:2], "skipped": {"a": [1]}, "casks": [RECORDS[2]], "empty": []}
+    expected = [("formulae", RECORDS[0]), ("formulae", RECORDS[1]), ("casks", RECORDS[2])]
+
+    def check(size):
+        text = json.dumps(doc)
+        assert list(index_io.iter_object_arrays(io.StringIO(text))) == expected, size
+        assert _raises_value_error(lambda: list(index_io.iter_object_arrays(io.StringIO(text[:-10])))), size
+        assert _raises_value_error(lambda: list(index_io.iter_object_arrays(io.StringIO("[]")))), size
+    _chunked(check)
+
+def test_iter_index_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for fmt in index_io.FORMATS:
+            for compress in ("none", "gzip"):
+                suffix = index_io.index_file_name(fmt, compress)[len(index_io.INDEX_BASENAME):]
+                path = os.path.join(tmp, f"{fmt}-{compress}{suffix}")
+                with open(path, "wb") as raw:
+                    f = gzip.GzipFile(fileobj=raw, mode="wb") if compress == "gzip" else raw
+                    text = (json.dumps(RECORDS) if fmt != "ndjson"
+                            else "".join(json.dumps(r) + "\n" for r in RECORDS))
+                    f.write(text.encode())
+                    f.close()
+                paths.append(path)
+
+        truncated = []
+        for path in paths:
+            if path.endswith(".gz"):
+                data = Path(path).read_bytes()
+                cut = path.replace(".gz", "-cut.gz")
+                Path(cut).write_bytes(data[:len(data) // 2])
+                truncated.append(cut)
+        cut_json = os.path.join(tmp, "cut.json")
+        Path(cut_json).write_text(json.dumps(RECORDS)[:-1])
+        truncated.append(cut_json)
+
+        def check(size):
+            for path in paths:
+                assert list(index_io.iter_index_file(path)) == RECORDS, (path, size)
+            for path in truncated:
+                assert _raises_value_error(lambda: list(index_io.iter_index_file(path))), (path, size)
+        _chunked(check)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
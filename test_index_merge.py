@@ -0,0 +1,72 @@
+"""Fleet merges in brew_conversion/index_merge.py and --host queries on the result.
+
+Runs under pytest, or directly: python3 test_index_merge.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "brew_conversion"))
+sys.path.insert(0, str(ROOT))
+from brew_first_installs import Query, query_range
+from index_io import iter_index_file
+from index_merge import merge_indexes
+
+DAY = 86400
+
+def _record(formula, version, epoch):
+    return {"formula": formula, "version": version, "install_path": f"/Cellar/{formula}/{version}",
+            "install_time": f"t{epoch}", "install_epoch": epoch, "first_installed": True,
+            "first_installed_epoch": epoch, "first_installed_time": f"t{epoch}"}
+
+def _fleet(tmp, now):
+    # wget went onto mac-a first and zsh onto mac-b first; both hosts have both
+    hosts = {
+        "mac-a": [_record("wget", "1.0", now - 20 * DAY), _record("zsh", "5", now - 3 * DAY)],
+        "mac-b": [_record("wget", "1.0", now - 5 * DAY), _record("zsh", "5", now - 10 * DAY)],
+    }
+    inputs = []
+    for host, records in hosts.items():
+        path = os.path.join(tmp, f"{host}.json")
+        Path(path).write_text(json.dumps(records))
+        inputs.append((host, path))
+    output = os.path.join(tmp, "fleet.ndjson")
+    assert merge_indexes(inputs, output, "ndjson") == 4
+    return output
+
+def test_host_first_installed():
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        fleet = _fleet(tmp, now)
+        flags = {(r["formula"], r["host"]): (r["first_installed"], r["host_first_installed"])
+                 for r in iter_index_file(fleet)}
+        assert flags == {
+            ("wget", "mac-a"): (True, True), ("wget", "mac-b"): (False, True),
+            ("zsh", "mac-b"): (True, True), ("zsh", "mac-a"): (False, True),
+        }
+
+def test_host_query():
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        fleet = _fleet(tmp, now)
+        q = Query(index_path=fleet)
+        for rows in (query_range(now - 30 * DAY, now, host="mac-b", index_path=fleet),
+                     q.range(now - 30 * DAY, now, host="mac-b")):
+            # Both of mac-b's first installs, dated on mac-b, not only zsh
+            assert [(r["formula"], r["first_installed_epoch"]) for r in rows] == [
+                ("zsh", now - 10 * DAY), ("wget", now - 5 * DAY)]
+        for rows in (query_range(now - 7 * DAY, now, host="mac-a", index_path=fleet),
+                     q.range(now - 7 * DAY, now, host="mac-a")):
+            assert [r["formula"] for r in rows] == ["zsh"]
+        for rows in (query_range(now - 30 * DAY, now, index_path=fleet), q.range(now - 30 * DAY, now)):
+            assert [(r["formula"], r["host"]) for r in rows] == [("wget", "mac-a"), ("zsh", "mac-b")]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")